@@ -57,13 +57,18 @@ async def lifespan(app: FastAPI):
     global agent_instance
     agent_instance = Manus()
     agent_instance.state = AgentState.IDLE
-    
+
+    # Iniciar consumidor de notificações de threshold de feedback
+    await feedback_service.start_feedback_listener()
+
     logger.info("✅ Sistema inicializado com sucesso")
-    
+
     yield
-    
+
     # Shutdown
     logger.info("🛑 Encerrando sistema...")
+    await feedback_service.stop_feedback_listener()
+    await metrics_service.close()
     if agent_instance:
         await agent_instance.cleanup()
 
@@ -154,6 +159,7 @@ async def chat_completions(
             
             # Buscar contexto relevante da base de conhecimento
             relevant_context = await knowledge_service.search_relevant_context(
+                db_session,
                 query=last_user_message,
                 limit=3
             )
@@ -350,6 +356,11 @@ async def get_system_metrics(db_session = Depends(get_db_session)):
         logger.error(f"Erro ao obter métricas: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/debug/pool")
+async def get_pool_status():
+    """Obter o estado do pool de conexões (observabilidade)"""
+    return metrics_service.get_pool_status()
+
 # Funções auxiliares para tarefas em background
 async def save_conversation_to_db(db_session, messages, response):
     """Salvar conversa no banco de dados"""
@@ -233,6 +233,7 @@ async def chat_completions(
         relevant_context = ""
         if knowledge_service:
             relevant_context = await knowledge_service.search_relevant_context(
+                db_session,
                 query=last_user_message,
                 limit=3
             )
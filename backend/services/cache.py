@@ -0,0 +1,79 @@
+"""
+Cache Redis de curta duração para consultas de dashboard
+Sistema de IA Conversacional Avançada
+"""
+
+import os
+import json
+import time
+from typing import Any, Awaitable, Callable
+
+from app.logger import logger
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_redis_client = None
+
+
+def _get_client():
+    """Obter cliente Redis compartilhado (lazy)"""
+    global _redis_client
+    if aioredis is None:
+        return None
+    if _redis_client is None:
+        _redis_client = aioredis.from_url(
+            REDIS_URL,
+            encoding="utf-8",
+            decode_responses=True,
+            socket_connect_timeout=1,
+            socket_timeout=1,
+        )
+    return _redis_client
+
+
+def get_redis():
+    """Cliente Redis compartilhado, ou None se o driver não está instalado"""
+    return _get_client()
+
+
+def time_bucket(ttl_seconds: int) -> int:
+    """Bucket de tempo alinhado ao TTL, para compor chaves de cache"""
+    return int(time.time() // ttl_seconds)
+
+
+async def cached(
+    key: str,
+    ttl_seconds: int,
+    coro_factory: Callable[[], Awaitable[Any]]
+) -> Any:
+    """Cache read-through com TTL curto e fallback gracioso
+
+    Consultas de dashboard são determinísticas dentro de janelas de poucos
+    minutos; um GET no Redis (~100µs) substitui várias idas ao banco.
+    Qualquer erro de Redis degrada silenciosamente para a consulta direta.
+    """
+    client = _get_client()
+
+    if client is not None:
+        try:
+            value = await client.get(key)
+            if value is not None:
+                return json.loads(value)
+        except Exception as e:
+            logger.warning(f"⚠️ Cache Redis indisponível (get {key}): {e}")
+            client = None
+
+    value = await coro_factory()
+
+    if client is not None:
+        try:
+            await client.setex(key, ttl_seconds, json.dumps(value, default=str))
+        except Exception as e:
+            logger.warning(f"⚠️ Cache Redis indisponível (set {key}): {e}")
+
+    return value
@@ -52,6 +52,24 @@ celery_app.conf.beat_schedule = {
         'schedule': crontab(minute=0, hour='*/6'),  # A cada 6 horas
     },
     
+    # Atualização das views materializadas dos dashboards a cada 5 minutos
+    'refresh-materialized-views': {
+        'task': 'backend.services.celery_tasks.refresh_materialized_views',
+        'schedule': 300.0,  # A cada 5 minutos
+    },
+
+    # Rollup diário de estatísticas de feedback a cada 15 minutos
+    'rollup-feedback-daily': {
+        'task': 'backend.services.celery_tasks.rollup_feedback_daily',
+        'schedule': crontab(minute='*/15'),
+    },
+
+    # Drenagem dos contadores de uso de conhecimento a cada 30 segundos
+    'flush-knowledge-usage': {
+        'task': 'backend.services.celery_tasks.flush_knowledge_usage',
+        'schedule': 30.0,
+    },
+
     # Limpeza de dados antigos diariamente
     'cleanup-old-data': {
         'task': 'backend.services.celery_tasks.cleanup_old_data',
@@ -5,13 +5,15 @@ Sistema de IA Conversacional Avançada
 
 import asyncio
 import json
+import re
 import uuid
 from typing import Dict, Any, List
 from datetime import datetime, timedelta
 
 from celery import current_task
+from sqlalchemy import text
 from backend.services.celery_app import celery_app
-from backend.database.connection import AsyncSessionLocal
+from backend.database.connection import AsyncSessionLocal, engine
 from backend.services.feedback_service import FeedbackService
 from backend.services.knowledge_service import KnowledgeService
 from backend.services.metrics_service import MetricsService
@@ -67,26 +69,25 @@ async def _analyze_feedback_batch_async():
             }
             
             feedback_ids_to_mark = []
-            
+            knowledge_items = []
+
             for feedback in feedbacks:
                 feedback_id, message_id, rating, comment, feedback_type, created_at = feedback
                 feedback_ids_to_mark.append(feedback_id)
-                
+
                 if rating >= 4:
                     analysis_results["positive_feedback"] += 1
-                    
+
                     # Extrair conhecimento de feedback positivo
                     if comment and len(comment) > 50:
-                        await knowledge_service.add_knowledge_item(
-                            session,
-                            title=f"Conhecimento de feedback positivo",
-                            content=comment,
-                            category="feedback_derived",
-                            source="user_feedback",
-                            confidence_score=0.8
-                        )
-                        analysis_results["knowledge_updates"] += 1
-                        
+                        knowledge_items.append({
+                            "title": "Conhecimento de feedback positivo",
+                            "content": comment,
+                            "category": "feedback_derived",
+                            "source": "user_feedback",
+                            "confidence_score": 0.8
+                        })
+
                 elif rating <= 2:
                     analysis_results["negative_feedback"] += 1
                     
@@ -96,12 +97,16 @@ async def _analyze_feedback_batch_async():
                         if improvement_area:
                             analysis_results["improvement_areas"].append(improvement_area)
             
+            # Inserir conhecimentos extraídos em um único lote
+            if knowledge_items:
+                await knowledge_service.add_knowledge_items_bulk(session, knowledge_items)
+                analysis_results["knowledge_updates"] = len(knowledge_items)
+
             # Marcar feedbacks como processados
             await feedback_service.mark_feedback_processed(session, feedback_ids_to_mark)
             
             # Registrar métricas da análise
             await metrics_service.record_metric(
-                session,
                 "feedback_analysis_processed",
                 len(feedbacks),
                 "counter",
@@ -113,21 +118,24 @@ async def _analyze_feedback_batch_async():
         except Exception as e:
             logger.error(f"❌ Erro na análise assíncrona de feedback: {e}", exc_info=True)
             raise
+        finally:
+            # Drenar métricas bufferizadas antes do asyncio.run() encerrar
+            await metrics_service.close()
+
+# Regex única pré-compilada com grupos nomeados por categoria: uma
+# passada pelo comentário em vez de até 15 buscas de substring + .lower()
+_ISSUE_RE = re.compile(
+    r'(?P<performance>lento|devagar|demora|tempo)'
+    r'|(?P<accuracy>errado|incorreto|erro|impreciso)'
+    r'|(?P<clarity>confuso|não entendi|unclear|vago)'
+    r'|(?P<completeness>incompleto|faltou|mais detalhes)',
+    re.IGNORECASE
+)
 
 def _extract_improvement_area(comment: str) -> str:
     """Extrair área de melhoria de comentário negativo"""
-    comment_lower = comment.lower()
-    
-    if any(word in comment_lower for word in ['lento', 'devagar', 'demora', 'tempo']):
-        return "performance"
-    elif any(word in comment_lower for word in ['errado', 'incorreto', 'erro', 'impreciso']):
-        return "accuracy"
-    elif any(word in comment_lower for word in ['confuso', 'não entendi', 'unclear', 'vago']):
-        return "clarity"
-    elif any(word in comment_lower for word in ['incompleto', 'faltou', 'mais detalhes']):
-        return "completeness"
-    else:
-        return "general"
+    match = _ISSUE_RE.search(comment)
+    return match.lastgroup if match else "general"
 
 @celery_app.task(bind=True, name="optimize_model_parameters")
 def optimize_model_parameters(self):
@@ -241,6 +249,174 @@ def generate_embeddings(self, knowledge_id: str, content: str):
         logger.error(f"❌ Erro ao gerar embeddings: {e}", exc_info=True)
         self.retry(countdown=60, max_retries=3)
 
+@celery_app.task(bind=True, name="refresh_materialized_views")
+def refresh_materialized_views(self):
+    """Atualizar views materializadas dos dashboards"""
+    try:
+        logger.info("🔄 Atualizando views materializadas...")
+
+        result = asyncio.run(_refresh_materialized_views_async())
+
+        logger.info(f"✅ Views materializadas atualizadas: {result}")
+        return result
+
+    except Exception as e:
+        logger.error(f"❌ Erro ao atualizar views materializadas: {e}", exc_info=True)
+        self.retry(countdown=60, max_retries=3)
+
+async def _refresh_materialized_views_async():
+    """Função assíncrona para atualizar as views materializadas"""
+    views = [
+        "mv_feedback_stats_7d",
+        "mv_feedback_by_category_7d",
+        "mv_knowledge_stats",
+        "mv_knowledge_category_counts",
+        "mv_knowledge_most_used",
+        "mv_conv_stats_30d",
+        "mv_perf_metrics_24h",
+        "mv_learning_stats_7d",
+    ]
+
+    # CONCURRENTLY (apoiado nos índices únicos das views) troca o conteúdo
+    # sem o ACCESS EXCLUSIVE que bloquearia os dashboards durante o
+    # refresh; precisa rodar fora de transação, daí o AUTOCOMMIT
+    refreshed = 0
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for view_name in views:
+            # Isolar cada view: uma falha não pode abortar o refresh das
+            # demais
+            try:
+                await conn.execute(text(
+                    f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name}"
+                ))
+                refreshed += 1
+            except Exception as e:
+                logger.error(
+                    f"❌ Erro ao atualizar view {view_name}: {e}",
+                    exc_info=True
+                )
+
+    return {"refreshed_views": refreshed}
+
+@celery_app.task(bind=True, name="rollup_feedback_daily")
+def rollup_feedback_daily(self):
+    """Atualizar o rollup diário de estatísticas de feedback"""
+    try:
+        result = asyncio.run(_rollup_feedback_daily_async())
+
+        logger.info(f"📊 Rollup diário de feedback atualizado: {result}")
+        return result
+
+    except Exception as e:
+        logger.error(f"❌ Erro no rollup diário de feedback: {e}", exc_info=True)
+        self.retry(countdown=300, max_retries=3)
+
+async def _rollup_feedback_daily_async():
+    """Função assíncrona para o upsert do rollup diário de feedback"""
+    async with AsyncSessionLocal() as session:
+        # Reconciliação: o rollup é mantido incrementalmente no insert de
+        # feedback; aqui reagregamos apenas os dias ainda abertos (ontem e
+        # hoje) a partir da tabela base para corrigir qualquer desvio
+        result = await session.execute(text("""
+            INSERT INTO feedback_daily_stats
+                (date, total_feedback, sum_rating, avg_rating, positive_count, negative_count, updated_at)
+            SELECT
+                DATE(created_at) AS day,
+                COUNT(*),
+                SUM(rating),
+                AVG(rating),
+                COUNT(*) FILTER (WHERE rating >= 4),
+                COUNT(*) FILTER (WHERE rating <= 2),
+                CURRENT_TIMESTAMP
+            FROM feedback
+            WHERE created_at >= CURRENT_DATE - INTERVAL '1 day'
+            GROUP BY day
+            ON CONFLICT (date) DO UPDATE SET
+                total_feedback = EXCLUDED.total_feedback,
+                sum_rating = EXCLUDED.sum_rating,
+                avg_rating = EXCLUDED.avg_rating,
+                positive_count = EXCLUDED.positive_count,
+                negative_count = EXCLUDED.negative_count,
+                updated_at = EXCLUDED.updated_at
+        """))
+        await session.commit()
+
+        return {"days_upserted": result.rowcount}
+
+@celery_app.task(bind=True, name="flush_knowledge_usage")
+def flush_knowledge_usage(self):
+    """Drenar contadores de uso de conhecimento do Redis para o PostgreSQL"""
+    try:
+        result = asyncio.run(_flush_knowledge_usage_async())
+
+        if result.get("flushed"):
+            logger.info(f"📚 Contadores de uso drenados: {result}")
+        return result
+
+    except Exception as e:
+        logger.error(f"❌ Erro ao drenar contadores de uso: {e}", exc_info=True)
+        self.retry(countdown=30, max_retries=3)
+
+async def _flush_knowledge_usage_async():
+    """Função assíncrona para drenar os contadores de uso acumulados"""
+    from backend.services.cache import get_redis
+
+    client = get_redis()
+    if client is None:
+        return {"flushed": 0}
+
+    # Ler HGETALL e depois DELETE perderia os HINCRBYs concorrentes que
+    # chegassem entre as duas operações; em vez disso, RENAME move os
+    # hashes atomicamente para chaves de rascunho (os incrementos novos
+    # recomeçam nas chaves vivas) e o flush lê o rascunho com calma.
+    # Rascunho já existente é sobra de uma execução anterior que falhou
+    # antes de apagar — drenamos ele primeiro em vez de sobrescrevê-lo
+    usage = await client.hgetall("kb:usage:flush")
+    if not usage:
+        for key in ("kb:usage", "kb:last_used"):
+            try:
+                await client.rename(key, f"{key}:flush")
+            except Exception:
+                # Chave inexistente: nada acumulado desde o último ciclo
+                pass
+
+        usage = await client.hgetall("kb:usage:flush")
+        if not usage:
+            return {"flushed": 0}
+
+    last_used = await client.hgetall("kb:last_used:flush")
+
+    ids = list(usage.keys())
+    counts = [int(usage[i]) for i in ids]
+    times = [float(last_used.get(i, 0)) for i in ids]
+
+    async with AsyncSessionLocal() as session:
+        # Um único UPDATE em lote via unnest: centenas de leituras viram
+        # uma escrita a cada ciclo do beat
+        await session.execute(text("""
+            UPDATE knowledge_base kb
+            SET usage_count = kb.usage_count + v.c,
+                last_used_at = GREATEST(
+                    COALESCE(kb.last_used_at, 'epoch'::timestamptz),
+                    to_timestamp(v.t)
+                )
+            FROM (
+                SELECT unnest(CAST(:ids AS uuid[])) as id,
+                       unnest(CAST(:counts AS int[])) as c,
+                       unnest(CAST(:times AS float8[])) as t
+            ) v
+            WHERE kb.id = v.id
+        """), {"ids": ids, "counts": counts, "times": times})
+
+        await session.commit()
+
+    # Só depois do commit: se a gravação falhar, o rascunho sobrevive e a
+    # próxima execução o drena
+    await client.delete("kb:usage:flush", "kb:last_used:flush")
+
+    return {"flushed": len(ids)}
+
 @celery_app.task(bind=True, name="cleanup_old_data")
 def cleanup_old_data(self):
     """Limpeza de dados antigos"""
@@ -405,7 +581,6 @@ async def _analyze_performance_trends_async():
                     
                     # Salvar alerta como métrica
                     await metrics_service.record_metric(
-                        session,
                         "system_alert",
                         avg_recent,
                         "gauge",
@@ -428,7 +603,6 @@ async def _analyze_performance_trends_async():
                     }
                     
                     await metrics_service.record_metric(
-                        session,
                         "system_alert",
                         avg_recent_time,
                         "gauge",
@@ -445,6 +619,9 @@ async def _analyze_performance_trends_async():
         except Exception as e:
             logger.error(f"❌ Erro na análise de tendências assíncrona: {e}", exc_info=True)
             raise
+        finally:
+            # Drenar métricas bufferizadas antes do asyncio.run() encerrar
+            await metrics_service.close()
 
 @celery_app.task(bind=True, name="process_conversation_learning")
 def process_conversation_learning(self, conversation_id: str):
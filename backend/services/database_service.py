@@ -6,7 +6,7 @@ Sistema de IA Conversacional Avançada
 import uuid
 import json
 import asyncio
-from typing import Optional, List, Dict, Any
+from typing import AsyncIterator, Optional, List, Dict, Any
 from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy import text, MetaData, Table, Column, String, DateTime, Integer, Float, Boolean, Text, JSON
@@ -19,6 +19,37 @@ from models.api_models import ChatMessage
 # Base para modelos SQLAlchemy
 Base = declarative_base()
 
+# Upsert dos rollups multi-granularidade de métricas: o lote chega como
+# arrays paralelos, o CROSS JOIN com as granularidades (10s/1min/1h/1d)
+# bucketiza tudo em uma passada e o ON CONFLICT recombina as estatísticas
+# suficientes (soma/mín/máx/contagem) com o acumulado
+_SQL_UPSERT_METRIC_ROLLUPS = text("""
+    INSERT INTO performance_metrics_rollup
+        (metric_name, granularity_sec, bucket_ts, sum_value, min_value, max_value, sample_count)
+    SELECT
+        r.name,
+        g.granularity_sec,
+        to_timestamp(floor(extract(epoch FROM r.ts) / g.granularity_sec)
+                     * g.granularity_sec) AS bucket_ts,
+        SUM(r.value),
+        MIN(r.value),
+        MAX(r.value),
+        COUNT(*)
+    FROM unnest(
+        CAST(:names AS text[]),
+        CAST(:values AS double precision[]),
+        CAST(:ts AS timestamptz[])
+    ) AS r(name, value, ts)
+    CROSS JOIN unnest(ARRAY[10, 60, 3600, 86400]) AS g(granularity_sec)
+    GROUP BY r.name, g.granularity_sec, bucket_ts
+    ON CONFLICT (metric_name, granularity_sec, bucket_ts) DO UPDATE SET
+        sum_value = performance_metrics_rollup.sum_value + EXCLUDED.sum_value,
+        min_value = LEAST(performance_metrics_rollup.min_value, EXCLUDED.min_value),
+        max_value = GREATEST(performance_metrics_rollup.max_value, EXCLUDED.max_value),
+        sample_count = performance_metrics_rollup.sample_count + EXCLUDED.sample_count,
+        updated_at = CURRENT_TIMESTAMP
+""")
+
 class DatabaseService:
     """Serviço principal para gerenciamento do banco de dados PostgreSQL"""
     
@@ -27,20 +58,32 @@ class DatabaseService:
         self.engine = None
         self.session_factory = None
         self.metadata = MetaData()
-        
+
     async def initialize(self):
         """Inicializar conexão com banco de dados"""
         try:
             logger.info("🗄️ Inicializando serviço de banco de dados...")
             
-            # Criar engine assíncrono
+            # Criar engine assíncrono com pool dimensionado e prepared
+            # statements habilitados no driver asyncpg
             self.engine = create_async_engine(
                 self.database_url,
                 echo=False,
-                pool_size=10,
-                max_overflow=20,
+                pool_size=20,
+                max_overflow=0,
+                pool_timeout=5,
                 pool_pre_ping=True,
-                pool_recycle=3600,
+                pool_recycle=1800,
+                query_cache_size=1200,
+                insertmanyvalues_page_size=1000,
+                connect_args={
+                    "server_settings": {
+                        "jit": "off",
+                        "application_name": "openmanus",
+                    },
+                    "statement_cache_size": 2048,
+                    "command_timeout": 30,
+                },
             )
             
             # Criar session factory
@@ -52,19 +95,113 @@ class DatabaseService:
             
             # Verificar conexão
             await self.health_check()
-            
-            # Criar schema se necessário
-            await self.create_schema()
-            
-            # Inserir configurações padrão
-            await self.insert_default_config()
-            
+
+            # Criar schema apenas se necessário; em warm restarts o probe
+            # evita rodar DDL (e a contenção de locks de catálogo) à toa
+            if await self._schema_installed():
+                logger.info("⏭️ Schema já instalado - pulando DDL de inicialização")
+            else:
+                await self._install_schema_with_lock()
+
             logger.info("✅ Serviço de banco de dados inicializado")
             
         except Exception as e:
             logger.error(f"❌ Erro ao inicializar banco de dados: {e}", exc_info=True)
             raise
     
+    # Chave do advisory lock que serializa a instalação do schema
+    SCHEMA_LOCK_KEY = 777001
+
+    # Versão do schema desta árvore de código, registrada em system_config
+    # após a instalação. Qualquer mudança de DDL (tabelas, colunas,
+    # índices, views) deve incrementá-la: instalações existentes com
+    # versão menor reaplicam o DDL (que é todo idempotente) na subida
+    SCHEMA_VERSION = 5
+
+    async def _schema_installed(self) -> bool:
+        """Probe barato: compara a versão de schema registrada no banco
+
+        Checar só a existência de uma tabela deixaria instalações antigas
+        sem os objetos adicionados depois (rollups, partições, colunas
+        novas); a versão explícita força a reaplicação do DDL quando o
+        código avança.
+        """
+        async with self.engine.begin() as conn:
+            has_config = (await conn.execute(text("""
+                SELECT EXISTS (
+                    SELECT 1 FROM information_schema.tables
+                    WHERE table_schema = 'public' AND table_name = 'system_config'
+                )
+            """))).scalar()
+            if not has_config:
+                return False
+
+            # Instalações anteriores à série de colunas tipadas têm
+            # system_config sem value_int; consultar a coluna direto
+            # quebraria o probe com UndefinedColumn antes de o DDL ter a
+            # chance de criá-la
+            has_value_int = (await conn.execute(text("""
+                SELECT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = 'public'
+                    AND table_name = 'system_config'
+                    AND column_name = 'value_int'
+                )
+            """))).scalar()
+            if not has_value_int:
+                return False
+
+            version = (await conn.execute(text("""
+                SELECT value_int FROM system_config
+                WHERE config_key = 'schema_version'
+            """))).scalar()
+            return version is not None and version >= self.SCHEMA_VERSION
+
+    async def _record_schema_version(self):
+        """Registrar a versão de schema aplicada"""
+        async with self.engine.begin() as conn:
+            await conn.execute(text("""
+                INSERT INTO system_config
+                    (config_key, config_value, value_type, value_int, description)
+                VALUES ('schema_version', :value_json, 'int', :version,
+                        'Versão do schema aplicada na inicialização')
+                ON CONFLICT (config_key) DO UPDATE SET
+                    config_value = EXCLUDED.config_value,
+                    value_type = EXCLUDED.value_type,
+                    value_int = EXCLUDED.value_int,
+                    updated_at = CURRENT_TIMESTAMP
+            """), {
+                "value_json": json.dumps(self.SCHEMA_VERSION),
+                "version": self.SCHEMA_VERSION
+            })
+
+    async def _install_schema_with_lock(self):
+        """Instalar schema sob advisory lock (apenas um processo por vez)"""
+        async with self.engine.connect() as conn:
+            acquired = (await conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"),
+                {"key": self.SCHEMA_LOCK_KEY}
+            )).scalar()
+
+            if not acquired:
+                logger.info("⏳ Outro processo está instalando o schema - aguardando lock...")
+                await conn.execute(
+                    text("SELECT pg_advisory_lock(:key)"),
+                    {"key": self.SCHEMA_LOCK_KEY}
+                )
+
+            try:
+                # Re-checar sob o lock: outro processo pode ter concluído
+                if not await self._schema_installed():
+                    await self.create_schema()
+                    await self.insert_default_config()
+                    await self._record_schema_version()
+            finally:
+                await conn.execute(
+                    text("SELECT pg_advisory_unlock(:key)"),
+                    {"key": self.SCHEMA_LOCK_KEY}
+                )
+
     async def create_schema(self):
         """Criar schema do banco de dados"""
         try:
@@ -73,11 +210,12 @@ class DatabaseService:
             schema_sql = """
             -- Extensões necessárias
             CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+            CREATE EXTENSION IF NOT EXISTS "pgcrypto";
             CREATE EXTENSION IF NOT EXISTS "pg_trgm";
-            
+
             -- Tabela de Usuários
             CREATE TABLE IF NOT EXISTS users (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 username VARCHAR(50) UNIQUE NOT NULL,
                 email VARCHAR(100) UNIQUE NOT NULL,
                 password_hash VARCHAR(255) NOT NULL,
@@ -90,7 +228,7 @@ class DatabaseService:
             
             -- Tabela de Conversas
             CREATE TABLE IF NOT EXISTS conversations (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 user_id UUID REFERENCES users(id) ON DELETE CASCADE,
                 title VARCHAR(255) NOT NULL DEFAULT 'Nova Conversa',
                 status VARCHAR(20) DEFAULT 'active',
@@ -101,7 +239,7 @@ class DatabaseService:
             
             -- Tabela de Mensagens
             CREATE TABLE IF NOT EXISTS messages (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 conversation_id UUID REFERENCES conversations(id) ON DELETE CASCADE,
                 sender VARCHAR(50) NOT NULL,
                 content TEXT NOT NULL,
@@ -113,7 +251,7 @@ class DatabaseService:
             
             -- Tabela de Feedback
             CREATE TABLE IF NOT EXISTS feedback (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 message_id UUID REFERENCES messages(id) ON DELETE CASCADE,
                 user_id UUID REFERENCES users(id) ON DELETE CASCADE,
                 conversation_id UUID REFERENCES conversations(id) ON DELETE CASCADE,
@@ -123,10 +261,65 @@ class DatabaseService:
                 processed BOOLEAN DEFAULT false,
                 created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
             );
-            
+
+            -- Rollup diário de feedback: janelas de 7/14/30 dias viram
+            -- leituras de O(dias) linhas em vez de reagregar a tabela inteira
+            CREATE TABLE IF NOT EXISTS feedback_daily_stats (
+                date DATE PRIMARY KEY,
+                total_feedback INTEGER NOT NULL DEFAULT 0,
+                sum_rating BIGINT NOT NULL DEFAULT 0,
+                avg_rating DOUBLE PRECISION,
+                positive_count INTEGER NOT NULL DEFAULT 0,
+                negative_count INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+
+            -- Estatística suficiente para médias entre dias: diferente de
+            -- avg_rating, sum_rating é somável, então agregados de janelas
+            -- arbitrárias saem exatos com SUM(sum_rating)/SUM(total_feedback)
+            ALTER TABLE feedback_daily_stats ADD COLUMN IF NOT EXISTS
+                sum_rating BIGINT NOT NULL DEFAULT 0;
+
+            -- Backfill do rollup a partir do histórico de feedback:
+            -- instalações que já tinham dados antes do rollup existir
+            -- precisam dos dias antigos no agregado. DO NOTHING preserva
+            -- os dias já mantidos incrementalmente (e reconciliados pelo
+            -- beat), então reexecutar na subida é inócuo
+            INSERT INTO feedback_daily_stats
+                (date, total_feedback, sum_rating, avg_rating,
+                 positive_count, negative_count)
+            SELECT
+                DATE(created_at),
+                COUNT(*),
+                COALESCE(SUM(rating), 0),
+                AVG(rating),
+                COUNT(*) FILTER (WHERE rating >= 4),
+                COUNT(*) FILTER (WHERE rating <= 2)
+            FROM feedback
+            GROUP BY DATE(created_at)
+            ON CONFLICT (date) DO NOTHING;
+
+            -- Rollup multi-granularidade de métricas (10s/1min/1h/1d),
+            -- mantido incrementalmente no flush do buffer: uma passada
+            -- alimenta os quatro níveis e os leitores escolhem o nível
+            -- mais grosso que atende o zoom pedido. Substitui o antigo
+            -- rollup só-diário (metrics_daily_rollup)
+            DROP TABLE IF EXISTS metrics_daily_rollup;
+            CREATE TABLE IF NOT EXISTS performance_metrics_rollup (
+                metric_name VARCHAR(100) NOT NULL,
+                granularity_sec INTEGER NOT NULL,
+                bucket_ts TIMESTAMP WITH TIME ZONE NOT NULL,
+                sum_value DOUBLE PRECISION NOT NULL DEFAULT 0,
+                min_value DOUBLE PRECISION,
+                max_value DOUBLE PRECISION,
+                sample_count BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (metric_name, granularity_sec, bucket_ts)
+            );
+
             -- Tabela de Base de Conhecimento
             CREATE TABLE IF NOT EXISTS knowledge_base (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 title VARCHAR(255) NOT NULL,
                 content TEXT NOT NULL,
                 category VARCHAR(100),
@@ -138,23 +331,67 @@ class DatabaseService:
                 created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
                 chromadb_id UUID UNIQUE,
-                metadata JSONB DEFAULT '{}'
+                metadata JSONB DEFAULT '{}',
+                content_length INTEGER GENERATED ALWAYS AS (length(content)) STORED,
+                word_count INTEGER GENERATED ALWAYS AS (array_length(regexp_split_to_array(content, '\\s+'), 1)) STORED
             );
-            
+
+            -- Colunas geradas calculadas pelo PG no insert (instalações existentes)
+            ALTER TABLE knowledge_base ADD COLUMN IF NOT EXISTS
+                content_length INTEGER GENERATED ALWAYS AS (length(content)) STORED;
+            ALTER TABLE knowledge_base ADD COLUMN IF NOT EXISTS
+                word_count INTEGER GENERATED ALWAYS AS (array_length(regexp_split_to_array(content, '\\s+'), 1)) STORED;
+
             -- Tabela de Métricas de Performance
+            -- Particionada por RANGE(timestamp) em semanas ISO: a retenção
+            -- vira DROP da partição expirada (O(1), sem dead tuples nem
+            -- VACUUM) em vez de um DELETE que reescreve milhões de linhas.
+            -- As partições são UNLOGGED: telemetria efêmera de alto volume,
+            -- dispensa WAL (perda aceitável em crash). Uma instalação
+            -- anterior não particionada é descartada — mesma política das
+            -- views materializadas quando a definição muda.
+            DO $migrate_metrics$
+            BEGIN
+                IF EXISTS (SELECT 1 FROM pg_class
+                           WHERE relname = 'performance_metrics'
+                           AND relkind = 'r') THEN
+                    DROP TABLE performance_metrics;
+                END IF;
+            END $migrate_metrics$;
             CREATE TABLE IF NOT EXISTS performance_metrics (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+                id UUID NOT NULL DEFAULT gen_random_uuid(),
                 metric_name VARCHAR(100) NOT NULL,
                 metric_value NUMERIC NOT NULL,
                 metric_type VARCHAR(50) NOT NULL,
                 labels JSONB DEFAULT '{}',
-                timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                context JSONB DEFAULT '{}'
-            );
+                timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                context JSONB DEFAULT '{}',
+                PRIMARY KEY (id, timestamp)
+            ) PARTITION BY RANGE (timestamp);
+
+            -- Partições da semana corrente e da próxima, criadas já no
+            -- bootstrap; a manutenção contínua fica com cleanup_old_metrics
+            -- (to_char IYYY/IW casa com date.isocalendar() no Python)
+            DO $metric_partitions$
+            DECLARE
+                week_start date;
+                part_name text;
+            BEGIN
+                FOR i IN 0..1 LOOP
+                    week_start := (date_trunc('week', now()) + (i || ' weeks')::interval)::date;
+                    part_name := format('performance_metrics_y%sw%s',
+                                        to_char(week_start, 'IYYY'),
+                                        to_char(week_start, 'IW'));
+                    EXECUTE format(
+                        'CREATE UNLOGGED TABLE IF NOT EXISTS %I PARTITION OF performance_metrics FOR VALUES FROM (%L) TO (%L)',
+                        part_name, week_start, week_start + 7
+                    );
+                END LOOP;
+            END $metric_partitions$;
             
             -- Tabela de Sessões de Aprendizado
             CREATE TABLE IF NOT EXISTS learning_sessions (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 session_type VARCHAR(50) NOT NULL,
                 status VARCHAR(20) DEFAULT 'pending',
                 input_data JSONB,
@@ -166,19 +403,33 @@ class DatabaseService:
             );
             
             -- Tabela de Configurações do Sistema
+            -- Valores escalares ficam em colunas tipadas (value_*) para evitar
+            -- parse de JSONB no caminho quente de leitura; config_value JSONB
+            -- é mantido por compatibilidade
             CREATE TABLE IF NOT EXISTS system_config (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 config_key VARCHAR(100) UNIQUE NOT NULL,
                 config_value JSONB NOT NULL,
+                value_type VARCHAR(10),
+                value_bool BOOLEAN,
+                value_int BIGINT,
+                value_float DOUBLE PRECISION,
+                value_text TEXT,
                 description TEXT,
                 is_active BOOLEAN DEFAULT true,
                 created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
             );
+
+            ALTER TABLE system_config ADD COLUMN IF NOT EXISTS value_type VARCHAR(10);
+            ALTER TABLE system_config ADD COLUMN IF NOT EXISTS value_bool BOOLEAN;
+            ALTER TABLE system_config ADD COLUMN IF NOT EXISTS value_int BIGINT;
+            ALTER TABLE system_config ADD COLUMN IF NOT EXISTS value_float DOUBLE PRECISION;
+            ALTER TABLE system_config ADD COLUMN IF NOT EXISTS value_text TEXT;
             
             -- Tabela de Logs de Auditoria
             CREATE TABLE IF NOT EXISTS audit_logs (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 user_id UUID REFERENCES users(id),
                 action VARCHAR(100) NOT NULL,
                 resource_type VARCHAR(50) NOT NULL,
@@ -197,7 +448,10 @@ class DatabaseService:
             
             # Criar índices
             await self.create_indexes()
-            
+
+            # Criar views materializadas para os dashboards
+            await self.create_materialized_views()
+
             logger.info("✅ Schema criado com sucesso")
             
         except Exception as e:
@@ -211,14 +465,71 @@ class DatabaseService:
             -- Índices para otimização
             CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id);
             CREATE INDEX IF NOT EXISTS idx_conversations_created_at ON conversations(created_at DESC);
+            -- Cobre o COUNT(DISTINCT user_id) da janela de 30 dias com um
+            -- index-only scan
+            CREATE INDEX IF NOT EXISTS idx_conv_created_user
+                ON conversations(created_at)
+                INCLUDE (user_id);
             CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation_id);
+
+            -- Índices cobrindo (INCLUDE) para index-only scans nas leituras quentes
+            CREATE INDEX IF NOT EXISTS idx_conversations_user_cover
+                ON conversations(user_id, updated_at DESC)
+                INCLUDE (title, status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_messages_conv_ts_cover
+                ON messages(conversation_id, timestamp)
+                INCLUDE (sender, message_type);
             CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp DESC);
+            CREATE INDEX IF NOT EXISTS idx_messages_sender_ts ON messages(sender, timestamp DESC);
             CREATE INDEX IF NOT EXISTS idx_feedback_message_id ON feedback(message_id);
             CREATE INDEX IF NOT EXISTS idx_feedback_processed ON feedback(processed);
+
+            -- Índice parcial cobrindo para as consultas de análise de feedback
+            -- (comentários negativos recentes): index-only scan sobre a fatia
+            -- relevante, sem visitar o heap para ler comment
+            CREATE INDEX IF NOT EXISTS idx_feedback_neg_recent
+                ON feedback(created_at DESC, rating)
+                INCLUDE (comment)
+                WHERE comment IS NOT NULL;
+
+            -- Índice parcial para as janelas de feedback negativo das
+            -- sessões de aprendizado
+            CREATE INDEX IF NOT EXISTS idx_feedback_negative_created
+                ON feedback(created_at DESC)
+                WHERE rating <= 2;
             CREATE INDEX IF NOT EXISTS idx_knowledge_base_category ON knowledge_base(category);
             CREATE INDEX IF NOT EXISTS idx_knowledge_base_tags ON knowledge_base USING GIN(tags);
+            CREATE INDEX IF NOT EXISTS idx_knowledge_content_trgm ON knowledge_base USING GIN(content gin_trgm_ops);
+
+            -- Índice parcial para o ranking de itens mais utilizados
+            CREATE INDEX IF NOT EXISTS idx_knowledge_usage
+                ON knowledge_base(usage_count DESC)
+                WHERE usage_count > 0;
+
+            -- Janela de tópicos recentes da análise abrangente
+            CREATE INDEX IF NOT EXISTS idx_knowledge_last_used
+                ON knowledge_base(last_used_at DESC, category);
             CREATE INDEX IF NOT EXISTS idx_performance_metrics_name_timestamp ON performance_metrics(metric_name, timestamp DESC);
+
+            -- Parcial cobrindo para agregações de gauges recentes:
+            -- index-only scan sobre a fatia gauge, sem visitar o heap
+            CREATE INDEX IF NOT EXISTS idx_pm_gauge_recent
+                ON performance_metrics(metric_name, timestamp)
+                INCLUDE (metric_value)
+                WHERE metric_type = 'gauge';
+
+            -- Estatísticas estendidas: metric_name e metric_type são
+            -- correlacionados (cada métrica tem um tipo fixo); sem isso o
+            -- planner multiplica as seletividades e subestima as linhas
+            CREATE STATISTICS IF NOT EXISTS stats_pm_name_type
+                ON metric_name, metric_type FROM performance_metrics;
             CREATE INDEX IF NOT EXISTS idx_learning_sessions_type ON learning_sessions(session_type);
+
+            -- Parcial para a contagem de sessões concluídas recentes das
+            -- recomendações de aprendizado
+            CREATE INDEX IF NOT EXISTS idx_ls_started
+                ON learning_sessions(started_at)
+                WHERE status = 'completed';
             CREATE INDEX IF NOT EXISTS idx_system_config_key ON system_config(config_key);
             """
             
@@ -230,48 +541,284 @@ class DatabaseService:
         except Exception as e:
             logger.error(f"❌ Erro ao criar índices: {e}", exc_info=True)
     
+    # Views materializadas com agregados dos dashboards; atualizadas
+    # periodicamente (Celery beat) em vez de recalculadas a cada chamada
+    MATERIALIZED_VIEWS = [
+        "mv_feedback_stats_7d",
+        "mv_feedback_by_category_7d",
+        "mv_knowledge_stats",
+        "mv_knowledge_category_counts",
+        "mv_knowledge_most_used",
+        "mv_conv_stats_30d",
+        "mv_perf_metrics_24h",
+        "mv_learning_stats_7d",
+    ]
+
+    async def create_materialized_views(self):
+        """Criar views materializadas para agregados de dashboards"""
+        try:
+            views_sql = """
+            -- Recriada ao subir: ganhou a coluna constante key, que serve
+            -- de chave do índice único exigido pelo REFRESH CONCURRENTLY
+            -- (índice único por expressão como ((true)) não conta — o
+            -- Postgres exige índice apenas sobre colunas)
+            DROP MATERIALIZED VIEW IF EXISTS mv_feedback_stats_7d;
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_feedback_stats_7d AS
+            SELECT
+                true AS key,
+                COUNT(*) AS total_feedback,
+                AVG(rating) AS avg_rating,
+                COUNT(*) FILTER (WHERE rating >= 4) AS positive_feedback,
+                COUNT(*) FILTER (WHERE rating <= 2) AS negative_feedback,
+                COUNT(comment) AS with_comments
+            FROM feedback
+            WHERE created_at >= now() - interval '7 days';
+
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_feedback_by_category_7d AS
+            SELECT
+                feedback_type,
+                COUNT(*) AS count,
+                AVG(rating) AS avg_rating
+            FROM feedback
+            WHERE created_at >= now() - interval '7 days'
+            GROUP BY feedback_type;
+
+            -- Recriada ao subir pelo mesmo motivo: coluna key para o
+            -- índice único do REFRESH CONCURRENTLY
+            DROP MATERIALIZED VIEW IF EXISTS mv_knowledge_stats;
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_knowledge_stats AS
+            SELECT
+                true AS key,
+                COUNT(*) AS total_items,
+                COUNT(DISTINCT category) AS categories_count,
+                AVG(confidence_score) AS avg_confidence,
+                SUM(usage_count) AS total_usage,
+                MAX(created_at) AS last_added
+            FROM knowledge_base;
+
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_knowledge_category_counts AS
+            SELECT
+                COALESCE(category, 'Sem Categoria') AS category,
+                COUNT(*) AS count,
+                AVG(confidence_score) AS avg_confidence
+            FROM knowledge_base
+            GROUP BY category;
+
+            -- Recriada ao subir: ganhou a coluna id para servir de chave
+            -- do índice único exigido pelo REFRESH CONCURRENTLY (title
+            -- não tem garantia de unicidade)
+            DROP MATERIALIZED VIEW IF EXISTS mv_knowledge_most_used;
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_knowledge_most_used AS
+            SELECT id, title, usage_count, last_used_at
+            FROM knowledge_base
+            WHERE usage_count > 0
+            ORDER BY usage_count DESC
+            LIMIT 10;
+
+            -- Três contagens indexadas independentes em vez de um LEFT
+            -- JOIN com COUNT(DISTINCT ...): o join expande conversa x
+            -- mensagem para depois deduplicar; separadas, cada contagem é
+            -- um range scan simples (recriada: a definição mudou)
+            DROP MATERIALIZED VIEW IF EXISTS mv_conv_stats_30d;
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_conv_stats_30d AS
+            SELECT
+                true AS key,
+                (SELECT COUNT(*)
+                 FROM conversations
+                 WHERE created_at >= now() - interval '30 days') AS total_conversations,
+                (SELECT COUNT(*)
+                 FROM messages m
+                 JOIN conversations c ON c.id = m.conversation_id
+                 WHERE c.created_at >= now() - interval '30 days') AS total_messages,
+                (SELECT COUNT(DISTINCT user_id)
+                 FROM conversations
+                 WHERE created_at >= now() - interval '30 days') AS unique_users;
+
+            -- Aposentada: o bloco de feedback do dashboard agrega as
+            -- estatísticas suficientes de feedback_daily_stats (30 linhas,
+            -- mantidas no insert), sem depender do ciclo de refresh
+            DROP MATERIALIZED VIEW IF EXISTS mv_feedback_stats_30d;
+
+            -- Recriada ao subir: a definição ganhou p50/p95 e o IF NOT
+            -- EXISTS sozinho manteria a versão antiga em instalações já
+            -- existentes
+            DROP MATERIALIZED VIEW IF EXISTS mv_perf_metrics_24h;
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_perf_metrics_24h AS
+            SELECT
+                metric_name,
+                AVG(metric_value) AS avg_value,
+                MAX(metric_value) AS max_value,
+                MIN(metric_value) AS min_value,
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY metric_value) AS p50,
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY metric_value) AS p95,
+                COUNT(*) AS sample_count
+            FROM performance_metrics
+            WHERE timestamp >= now() - interval '24 hours'
+            AND metric_type = 'gauge'
+            GROUP BY metric_name;
+
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_learning_stats_7d AS
+            SELECT
+                session_type,
+                COUNT(*) AS total_sessions,
+                COUNT(*) FILTER (WHERE status = 'completed') AS completed_sessions,
+                AVG(EXTRACT(EPOCH FROM (completed_at - started_at))) AS avg_duration
+            FROM learning_sessions
+            WHERE started_at >= now() - interval '7 days'
+            GROUP BY session_type;
+
+            -- Índices únicos sobre as chaves de agrupamento: pré-requisito
+            -- do REFRESH MATERIALIZED VIEW CONCURRENTLY, que troca o
+            -- conteúdo sem o ACCESS EXCLUSIVE que bloquearia os leitores
+            -- a cada ciclo do beat. Para as views de linha única a chave
+            -- é a coluna constante key (o CONCURRENTLY não aceita índice
+            -- por expressão)
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_feedback_stats_7d_uniq
+                ON mv_feedback_stats_7d (key);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_feedback_by_category_7d_uniq
+                ON mv_feedback_by_category_7d (feedback_type);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_knowledge_stats_uniq
+                ON mv_knowledge_stats (key);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_knowledge_category_counts_uniq
+                ON mv_knowledge_category_counts (category);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_knowledge_most_used_uniq
+                ON mv_knowledge_most_used (id);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_conv_stats_30d_uniq
+                ON mv_conv_stats_30d (key);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_perf_metrics_24h_uniq
+                ON mv_perf_metrics_24h (metric_name);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_learning_stats_7d_uniq
+                ON mv_learning_stats_7d (session_type);
+            """
+
+            async with self.engine.begin() as conn:
+                await conn.execute(text(views_sql))
+
+            logger.info("✅ Views materializadas criadas")
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao criar views materializadas: {e}", exc_info=True)
+
+    async def refresh_materialized_views(self):
+        """Atualizar as views materializadas dos dashboards
+
+        CONCURRENTLY (viabilizado pelos índices únicos das views) troca o
+        conteúdo sem bloquear os leitores; exige rodar fora de transação,
+        daí o AUTOCOMMIT.
+        """
+        try:
+            async with self.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                for view_name in self.MATERIALIZED_VIEWS:
+                    # Isolar cada view: uma falha (ex.: view ainda não
+                    # criada) não pode abortar o refresh das demais
+                    try:
+                        await conn.execute(text(
+                            f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name}"
+                        ))
+                    except Exception as e:
+                        logger.error(
+                            f"❌ Erro ao atualizar view {view_name}: {e}",
+                            exc_info=True
+                        )
+
+            logger.info("🔄 Views materializadas atualizadas")
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao atualizar views materializadas: {e}", exc_info=True)
+
+    @staticmethod
+    def _typed_config_params(value: Any) -> Dict[str, Any]:
+        """Mapear um valor escalar de configuração para as colunas tipadas"""
+        params = {
+            "value_type": "json",
+            "value_bool": None,
+            "value_int": None,
+            "value_float": None,
+            "value_text": None,
+        }
+
+        if isinstance(value, bool):
+            params["value_type"] = "bool"
+            params["value_bool"] = value
+        elif isinstance(value, int):
+            params["value_type"] = "int"
+            params["value_int"] = value
+        elif isinstance(value, float):
+            params["value_type"] = "float"
+            params["value_float"] = value
+        elif isinstance(value, str):
+            params["value_type"] = "text"
+            params["value_text"] = value
+
+        return params
+
+    @staticmethod
+    def _config_value_from_row(value_type, value_bool, value_int, value_float, value_text, config_value):
+        """Reconstruir o valor a partir das colunas tipadas (fallback JSONB)"""
+        if value_type == "bool":
+            return value_bool
+        if value_type == "int":
+            return value_int
+        if value_type == "float":
+            return value_float
+        if value_type == "text":
+            return value_text
+        return json.loads(config_value) if config_value else None
+
     async def insert_default_config(self):
         """Inserir configurações padrão do sistema"""
         try:
             async with self.session_factory() as session:
-                # Verificar se já existem configurações
-                result = await session.execute(text("SELECT COUNT(*) FROM system_config"))
-                count = result.scalar()
-                
-                if count == 0:
-                    logger.info("📝 Inserindo configurações padrão...")
-                    
-                    default_configs = [
-                        ("auto_learning_enabled", True, "Habilitar aprendizado automático"),
-                        ("feedback_threshold", 3, "Número mínimo de feedbacks para mudanças"),
-                        ("max_context_length", 4096, "Comprimento máximo do contexto"),
-                        ("embedding_model", "all-MiniLM-L6-v2", "Modelo para embeddings"),
-                        ("response_temperature", 0.7, "Temperatura padrão para respostas"),
-                        ("max_knowledge_items", 10000, "Máximo de itens na base de conhecimento"),
-                        ("cleanup_days", 90, "Dias para manter dados antigos"),
-                        ("enable_metrics", True, "Habilitar coleta de métricas")
-                    ]
-                    
-                    for key, value, description in default_configs:
-                        await session.execute(text("""
-                            INSERT INTO system_config (config_key, config_value, description)
-                            VALUES (:key, :value, :description)
-                        """), {
-                            "key": key,
-                            "value": json.dumps(value),
-                            "description": description
-                        })
-                    
-                    # Criar usuário admin padrão
-                    await session.execute(text("""
-                        INSERT INTO users (username, email, password_hash, is_admin)
-                        VALUES ('admin', 'admin@sistema-ia.local', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewdBPj6hsxq5/Qe.', true)
-                        ON CONFLICT (username) DO NOTHING
-                    """))
-                    
-                    await session.commit()
-                    logger.info("✅ Configurações padrão inseridas")
-                
+                logger.info("📝 Inserindo configurações padrão...")
+
+                default_configs = [
+                    ("auto_learning_enabled", True, "Habilitar aprendizado automático"),
+                    ("feedback_threshold", 3, "Número mínimo de feedbacks para mudanças"),
+                    ("max_context_length", 4096, "Comprimento máximo do contexto"),
+                    ("embedding_model", "all-MiniLM-L6-v2", "Modelo para embeddings"),
+                    ("response_temperature", 0.7, "Temperatura padrão para respostas"),
+                    ("max_knowledge_items", 10000, "Máximo de itens na base de conhecimento"),
+                    ("cleanup_days", 90, "Dias para manter dados antigos"),
+                    ("enable_metrics", True, "Habilitar coleta de métricas")
+                ]
+
+                # Um único INSERT com lista de VALUES; ON CONFLICT garante
+                # idempotência sem o SELECT COUNT(*) preliminar
+                values_clause = ", ".join(
+                    f"(:key_{i}, :value_{i}, :vtype_{i}, :vbool_{i}, :vint_{i}, :vfloat_{i}, :vtext_{i}, :description_{i})"
+                    for i in range(len(default_configs))
+                )
+                params = {}
+                for i, (key, value, description) in enumerate(default_configs):
+                    typed = self._typed_config_params(value)
+                    params[f"key_{i}"] = key
+                    params[f"value_{i}"] = json.dumps(value)
+                    params[f"vtype_{i}"] = typed["value_type"]
+                    params[f"vbool_{i}"] = typed["value_bool"]
+                    params[f"vint_{i}"] = typed["value_int"]
+                    params[f"vfloat_{i}"] = typed["value_float"]
+                    params[f"vtext_{i}"] = typed["value_text"]
+                    params[f"description_{i}"] = description
+
+                await session.execute(text(f"""
+                    INSERT INTO system_config
+                        (config_key, config_value, value_type, value_bool,
+                         value_int, value_float, value_text, description)
+                    VALUES {values_clause}
+                    ON CONFLICT (config_key) DO NOTHING
+                """), params)
+
+                # Criar usuário admin padrão
+                await session.execute(text("""
+                    INSERT INTO users (username, email, password_hash, is_admin)
+                    VALUES ('admin', 'admin@sistema-ia.local', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewdBPj6hsxq5/Qe.', true)
+                    ON CONFLICT (username) DO NOTHING
+                """))
+
+                await session.commit()
+                logger.info("✅ Configurações padrão inseridas")
+
         except Exception as e:
             logger.error(f"❌ Erro ao inserir configurações padrão: {e}", exc_info=True)
     
@@ -285,40 +832,35 @@ class DatabaseService:
     ):
         """Salvar conversa completa no banco"""
         try:
-            # Criar conversa se não existir
-            conversation_id = str(uuid.uuid4())
-            
-            await db_session.execute(text("""
-                INSERT INTO conversations (id, user_id, title, metadata)
-                VALUES (:id, :user_id, :title, :metadata)
+            # Criar conversa deixando o PostgreSQL gerar o UUID (gen_random_uuid)
+            result = await db_session.execute(text("""
+                INSERT INTO conversations (user_id, title, metadata)
+                VALUES (:user_id, :title, :metadata)
+                RETURNING id
             """), {
-                "id": conversation_id,
                 "user_id": user_id,
                 "title": f"Conversa {datetime.now().strftime('%d/%m/%Y %H:%M')}",
                 "metadata": json.dumps({"response_time": response_time})
             })
-            
-            # Salvar mensagens
+            conversation_id = str(result.scalar_one())
+
+            # Salvar mensagens (ids gerados pelo DEFAULT da coluna)
             for i, msg in enumerate(messages):
-                message_id = str(uuid.uuid4())
                 await db_session.execute(text("""
-                    INSERT INTO messages (id, conversation_id, sender, content, metadata)
-                    VALUES (:id, :conversation_id, :sender, :content, :metadata)
+                    INSERT INTO messages (conversation_id, sender, content, metadata)
+                    VALUES (:conversation_id, :sender, :content, :metadata)
                 """), {
-                    "id": message_id,
                     "conversation_id": conversation_id,
                     "sender": msg.role,
                     "content": msg.content,
                     "metadata": json.dumps({"order": i})
                 })
-            
+
             # Salvar resposta do assistente
-            response_id = str(uuid.uuid4())
             await db_session.execute(text("""
-                INSERT INTO messages (id, conversation_id, sender, content, metadata)
-                VALUES (:id, :conversation_id, :sender, :content, :metadata)
+                INSERT INTO messages (conversation_id, sender, content, metadata)
+                VALUES (:conversation_id, :sender, :content, :metadata)
             """), {
-                "id": response_id,
                 "conversation_id": conversation_id,
                 "sender": "assistant",
                 "content": response_content,
@@ -342,17 +884,18 @@ class DatabaseService:
         """Obter configuração atual do sistema"""
         try:
             result = await db_session.execute(text("""
-                SELECT config_key, config_value, description, is_active
+                SELECT config_key, config_value, value_type, value_bool,
+                       value_int, value_float, value_text, description, is_active
                 FROM system_config
                 WHERE is_active = true
                 ORDER BY config_key
             """))
-            
+
             config = {}
             for row in result.fetchall():
-                key, value, description, is_active = row
+                key, value, vtype, vbool, vint, vfloat, vtext, description, is_active = row
                 config[key] = {
-                    "value": json.loads(value) if value else None,
+                    "value": self._config_value_from_row(vtype, vbool, vint, vfloat, vtext, value),
                     "description": description,
                     "is_active": is_active
                 }
@@ -371,14 +914,21 @@ class DatabaseService:
     ):
         """Atualizar configuração do sistema"""
         try:
+            params = self._typed_config_params(config_value)
+            params["key"] = config_key
+            params["value"] = json.dumps(config_value)
+
             await db_session.execute(text("""
-                UPDATE system_config 
-                SET config_value = :value, updated_at = CURRENT_TIMESTAMP
+                UPDATE system_config
+                SET config_value = :value,
+                    value_type = :value_type,
+                    value_bool = :value_bool,
+                    value_int = :value_int,
+                    value_float = :value_float,
+                    value_text = :value_text,
+                    updated_at = CURRENT_TIMESTAMP
                 WHERE config_key = :key
-            """), {
-                "key": config_key,
-                "value": json.dumps(config_value)
-            })
+            """), params)
             
             await db_session.commit()
             logger.info(f"⚙️ Configuração atualizada: {config_key} = {config_value}")
@@ -388,75 +938,94 @@ class DatabaseService:
             logger.error(f"❌ Erro ao atualizar configuração: {e}", exc_info=True)
             raise
     
+    async def stream_conversation_history(
+        self,
+        db_session: AsyncSession,
+        user_id: Optional[str] = None,
+        limit: int = 50
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Obter histórico de conversas via cursor no servidor (streaming)"""
+        # SQL único e estável (sem f-string): o filtro opcional vira um
+        # predicado no próprio SQL, preservando o cache de prepared statements
+        result = await db_session.stream(text("""
+            SELECT
+                c.id, c.title, c.status, c.created_at, c.updated_at,
+                COUNT(m.id) as message_count,
+                AVG(f.rating) as avg_rating
+            FROM conversations c
+            LEFT JOIN messages m ON c.id = m.conversation_id
+            LEFT JOIN feedback f ON c.id = f.conversation_id
+            WHERE (CAST(:user_id AS uuid) IS NULL OR c.user_id = CAST(:user_id AS uuid))
+            GROUP BY c.id, c.title, c.status, c.created_at, c.updated_at
+            ORDER BY c.updated_at DESC
+            LIMIT :limit
+        """), {"user_id": user_id, "limit": limit})
+
+        async for row in result:
+            yield {
+                "id": row[0],
+                "title": row[1],
+                "status": row[2],
+                "created_at": row[3].isoformat(),
+                "updated_at": row[4].isoformat(),
+                "message_count": row[5] or 0,
+                "avg_rating": float(row[6]) if row[6] else None
+            }
+
     async def get_conversation_history(
-        self, 
-        db_session: AsyncSession, 
+        self,
+        db_session: AsyncSession,
         user_id: Optional[str] = None,
         limit: int = 50
     ) -> List[Dict[str, Any]]:
         """Obter histórico de conversas"""
         try:
-            where_clause = "WHERE c.user_id = :user_id" if user_id else ""
-            
-            result = await db_session.execute(text(f"""
-                SELECT 
-                    c.id, c.title, c.status, c.created_at, c.updated_at,
-                    COUNT(m.id) as message_count,
-                    AVG(f.rating) as avg_rating
-                FROM conversations c
-                LEFT JOIN messages m ON c.id = m.conversation_id
-                LEFT JOIN feedback f ON c.id = f.conversation_id
-                {where_clause}
-                GROUP BY c.id, c.title, c.status, c.created_at, c.updated_at
-                ORDER BY c.updated_at DESC
-                LIMIT :limit
-            """), {"user_id": user_id, "limit": limit})
-            
-            conversations = []
-            for row in result.fetchall():
-                conversations.append({
-                    "id": row[0],
-                    "title": row[1],
-                    "status": row[2],
-                    "created_at": row[3].isoformat(),
-                    "updated_at": row[4].isoformat(),
-                    "message_count": row[5] or 0,
-                    "avg_rating": float(row[6]) if row[6] else None
-                })
-            
-            return conversations
-            
+            return [
+                conversation
+                async for conversation in self.stream_conversation_history(
+                    db_session, user_id=user_id, limit=limit
+                )
+            ]
         except Exception as e:
             logger.error(f"❌ Erro ao obter histórico: {e}", exc_info=True)
             return []
-    
+
+    async def stream_conversation_messages(
+        self,
+        db_session: AsyncSession,
+        conversation_id: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Obter mensagens de uma conversa via cursor no servidor (streaming)"""
+        result = await db_session.stream(text("""
+            SELECT id, sender, content, message_type, metadata, timestamp
+            FROM messages
+            WHERE conversation_id = :conversation_id
+            ORDER BY timestamp ASC
+        """), {"conversation_id": conversation_id})
+
+        async for row in result:
+            yield {
+                "id": row[0],
+                "sender": row[1],
+                "content": row[2],
+                "message_type": row[3],
+                "metadata": row[4] if row[4] else {},
+                "timestamp": row[5].isoformat()
+            }
+
     async def get_conversation_messages(
-        self, 
-        db_session: AsyncSession, 
+        self,
+        db_session: AsyncSession,
         conversation_id: str
     ) -> List[Dict[str, Any]]:
         """Obter mensagens de uma conversa específica"""
         try:
-            result = await db_session.execute(text("""
-                SELECT id, sender, content, message_type, metadata, timestamp
-                FROM messages
-                WHERE conversation_id = :conversation_id
-                ORDER BY timestamp ASC
-            """), {"conversation_id": conversation_id})
-            
-            messages = []
-            for row in result.fetchall():
-                messages.append({
-                    "id": row[0],
-                    "sender": row[1],
-                    "content": row[2],
-                    "message_type": row[3],
-                    "metadata": row[4] if row[4] else {},
-                    "timestamp": row[5].isoformat()
-                })
-            
-            return messages
-            
+            return [
+                message
+                async for message in self.stream_conversation_messages(
+                    db_session, conversation_id
+                )
+            ]
         except Exception as e:
             logger.error(f"❌ Erro ao obter mensagens: {e}", exc_info=True)
             return []
@@ -480,11 +1049,11 @@ class DatabaseService:
             
             # Estatísticas de feedback
             result = await db_session.execute(text("""
-                SELECT 
+                SELECT
                     COUNT(*) as total_feedback,
                     AVG(rating) as avg_rating,
-                    COUNT(CASE WHEN rating >= 4 THEN 1 END) * 100.0 / COUNT(*) as positive_rate,
-                    COUNT(CASE WHEN processed = true THEN 1 END) as processed_feedback
+                    100.0 * COUNT(*) FILTER (WHERE rating >= 4) / NULLIF(COUNT(*), 0) as positive_rate,
+                    COUNT(*) FILTER (WHERE processed) as processed_feedback
                 FROM feedback
                 WHERE created_at >= CURRENT_DATE - INTERVAL '30 days'
             """))
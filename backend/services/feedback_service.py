@@ -4,19 +4,180 @@ Sistema de IA Conversacional Avançada
 """
 
 import uuid
+import json
+import asyncio
+import asyncpg
 from typing import Optional, List, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text, select, func
-from datetime import datetime, timedelta
 
 from app.logger import logger
+from backend.services.cache import cached, time_bucket
+
+# Statements SQL pré-construídos no nível do módulo: objetos estáveis
+# aproveitam o compiled cache do SQLAlchemy e mantêm quente o cache de
+# prepared statements do asyncpg
+_SQL_SAVE_FEEDBACK = text("""
+    WITH ins AS (
+        INSERT INTO feedback (id, message_id, user_id, conversation_id, rating, comment, feedback_type)
+        SELECT :id, :message_id, :user_id, m.conversation_id, :rating, :comment, :feedback_type
+        FROM messages m
+        WHERE m.id = :message_id
+        RETURNING message_id
+    ), cnt AS (
+        SELECT (SELECT COUNT(*) FROM (
+                    SELECT 1 FROM feedback
+                    WHERE message_id = :message_id
+                    LIMIT :threshold
+                ) bounded)
+             + (SELECT COUNT(*) FROM ins) as feedback_count
+    ), roll AS (
+        INSERT INTO feedback_daily_stats
+            (date, total_feedback, sum_rating, avg_rating, positive_count, negative_count)
+        SELECT CURRENT_DATE, 1, :rating, :rating,
+               CAST(:rating >= 4 AS int), CAST(:rating <= 2 AS int)
+        FROM ins
+        ON CONFLICT (date) DO UPDATE SET
+            total_feedback = feedback_daily_stats.total_feedback + 1,
+            sum_rating = feedback_daily_stats.sum_rating + EXCLUDED.sum_rating,
+            avg_rating = (feedback_daily_stats.sum_rating + EXCLUDED.sum_rating)::float
+                         / (feedback_daily_stats.total_feedback + 1),
+            positive_count = feedback_daily_stats.positive_count + EXCLUDED.positive_count,
+            negative_count = feedback_daily_stats.negative_count + EXCLUDED.negative_count,
+            updated_at = CURRENT_TIMESTAMP
+    ), ls AS (
+        INSERT INTO learning_sessions (id, session_type, status, input_data)
+        SELECT :session_id, 'feedback_analysis', 'pending', :input_data
+        FROM cnt
+        WHERE cnt.feedback_count >= :threshold
+          AND EXISTS (SELECT 1 FROM ins)
+        RETURNING id
+    )
+    SELECT
+        (SELECT COUNT(*) FROM ins) as inserted,
+        cnt.feedback_count,
+        CASE WHEN EXISTS (SELECT 1 FROM ls)
+             THEN pg_notify('feedback_threshold', CAST(:session_id AS text))
+        END as notified
+    FROM cnt
+""")
+
+_SQL_FEEDBACK_ANALYSIS_MV = text("""
+    WITH s AS (
+        SELECT total_feedback, avg_rating, positive_feedback,
+               negative_feedback, with_comments
+        FROM mv_feedback_stats_7d
+    ), c AS (
+        SELECT jsonb_agg(jsonb_build_object(
+                   'type', feedback_type,
+                   'count', count,
+                   'avg_rating', avg_rating
+               ) ORDER BY count DESC) as cats
+        FROM mv_feedback_by_category_7d
+    ), n AS (
+        SELECT jsonb_agg(jsonb_build_object(
+                   'comment', comment,
+                   'rating', rating,
+                   'created_at', created_at
+               ) ORDER BY created_at DESC) as ncs
+        FROM (
+            SELECT comment, rating, created_at
+            FROM feedback
+            WHERE created_at >= now() - make_interval(days => :days)
+            AND rating <= 2
+            AND comment IS NOT NULL
+            ORDER BY created_at DESC
+            LIMIT 10
+        ) q
+    )
+    SELECT jsonb_build_object(
+        'period_days', :days,
+        'total_feedback', COALESCE(s.total_feedback, 0),
+        'average_rating', COALESCE(s.avg_rating, 0),
+        'positive_feedback', COALESCE(s.positive_feedback, 0),
+        'negative_feedback', COALESCE(s.negative_feedback, 0),
+        'feedback_with_comments', COALESCE(s.with_comments, 0),
+        'categories', COALESCE(c.cats, '[]'::jsonb),
+        'recent_negative_comments', COALESCE(n.ncs, '[]'::jsonb)
+    )
+    FROM s, c, n
+""")
+
+_SQL_FEEDBACK_ANALYSIS_LIVE = text("""
+    WITH s AS (
+        SELECT
+            COUNT(*) as total_feedback,
+            AVG(rating) as avg_rating,
+            COUNT(*) FILTER (WHERE rating >= 4) as positive_feedback,
+            COUNT(*) FILTER (WHERE rating <= 2) as negative_feedback,
+            COUNT(comment) as with_comments
+        FROM feedback
+        WHERE created_at >= now() - make_interval(days => :days)
+    ), c AS (
+        SELECT jsonb_agg(jsonb_build_object(
+                   'type', feedback_type,
+                   'count', cnt,
+                   'avg_rating', ar
+               ) ORDER BY cnt DESC) as cats
+        FROM (
+            SELECT feedback_type, COUNT(*) as cnt, AVG(rating) as ar
+            FROM feedback
+            WHERE created_at >= now() - make_interval(days => :days)
+            GROUP BY feedback_type
+        ) q
+    ), n AS (
+        SELECT jsonb_agg(jsonb_build_object(
+                   'comment', comment,
+                   'rating', rating,
+                   'created_at', created_at
+               ) ORDER BY created_at DESC) as ncs
+        FROM (
+            SELECT comment, rating, created_at
+            FROM feedback
+            WHERE created_at >= now() - make_interval(days => :days)
+            AND rating <= 2
+            AND comment IS NOT NULL
+            ORDER BY created_at DESC
+            LIMIT 10
+        ) q
+    )
+    SELECT jsonb_build_object(
+        'period_days', :days,
+        'total_feedback', COALESCE(s.total_feedback, 0),
+        'average_rating', COALESCE(s.avg_rating, 0),
+        'positive_feedback', COALESCE(s.positive_feedback, 0),
+        'negative_feedback', COALESCE(s.negative_feedback, 0),
+        'feedback_with_comments', COALESCE(s.with_comments, 0),
+        'categories', COALESCE(c.cats, '[]'::jsonb),
+        'recent_negative_comments', COALESCE(n.ncs, '[]'::jsonb)
+    )
+    FROM s, c, n
+""")
+
+_SQL_IMPROVEMENT_SUMMARY = text(r"""
+    SELECT
+        COUNT(*) FILTER (WHERE rating <= 2 AND comment IS NOT NULL) as total_negative,
+        COUNT(*) FILTER (WHERE rating <= 2 AND comment ~* '\m(lento|devagar|demora)\M') as performance_count,
+        COUNT(*) FILTER (WHERE rating <= 2 AND comment ~* '\m(errado|incorreto|erro)\M') as accuracy_count,
+        COUNT(*) FILTER (WHERE rating <= 2 AND (comment ~* '\m(confuso|unclear)\M' OR comment ~* 'não entendi')) as clarity_count,
+        COUNT(*) FILTER (WHERE rating >= 4) * 100.0 / NULLIF(COUNT(*), 0) as positive_rate
+    FROM feedback
+    WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
+""")
+
+_SQL_MARK_PROCESSED = text("""
+    UPDATE feedback
+    SET processed = true
+    WHERE id = ANY(CAST(:ids AS uuid[]))
+""")
 
 class FeedbackService:
     """Serviço para gerenciar feedback dos usuários e aprendizado do sistema"""
-    
+
     def __init__(self):
         self.feedback_threshold = 3  # Mínimo de feedbacks para considerar mudanças
-        
+        self._listener_conn: Optional[asyncpg.Connection] = None
+
     async def save_feedback(
         self,
         db_session: AsyncSession,
@@ -29,163 +190,130 @@ class FeedbackService:
         """Salvar feedback do usuário no banco de dados"""
         try:
             feedback_id = str(uuid.uuid4())
-            
-            # Obter conversation_id da mensagem
-            result = await db_session.execute(text("""
-                SELECT conversation_id FROM messages WHERE id = :message_id
-            """), {"message_id": message_id})
-            
-            conversation_row = result.fetchone()
-            if not conversation_row:
-                raise ValueError(f"Mensagem {message_id} não encontrada")
-            
-            conversation_id = conversation_row[0]
-            
-            # Inserir feedback
-            await db_session.execute(text("""
-                INSERT INTO feedback (id, message_id, user_id, conversation_id, rating, comment, feedback_type)
-                VALUES (:id, :message_id, :user_id, :conversation_id, :rating, :comment, :feedback_type)
-            """), {
+            session_id = str(uuid.uuid4())
+
+            # Lookup do conversation_id, INSERT do feedback, contagem,
+            # criação condicional da sessão de aprendizado e pg_notify
+            # fundidos em um único CTE: uma ida ao banco e um único commit
+            # (um fsync em vez de dois). Ao atingir o threshold, o NOTIFY
+            # acorda o consumidor dedicado com o id da sessão já criada.
+            # A contagem externa usa o snapshot anterior ao INSERT (por isso
+            # soma as linhas inseridas pelo CTE) e é limitada ao threshold:
+            # o PG para na N-ésima linha em vez de enumerar todas.
+            result = await db_session.execute(_SQL_SAVE_FEEDBACK, {
                 "id": feedback_id,
+                "session_id": session_id,
+                "input_data": json.dumps({"message_id": message_id}),
                 "message_id": message_id,
                 "user_id": user_id,
-                "conversation_id": conversation_id,
                 "rating": rating,
                 "comment": comment,
-                "feedback_type": feedback_type
+                "feedback_type": feedback_type,
+                "threshold": self.feedback_threshold
             })
-            
+
+            inserted, feedback_count, _notified = result.fetchone()
+            if not inserted:
+                raise ValueError(f"Mensagem {message_id} não encontrada")
+
             await db_session.commit()
-            
+
             logger.info(f"💬 Feedback salvo: {feedback_id} (rating: {rating})")
-            
-            # Verificar se deve processar aprendizado
-            await self._check_learning_trigger(db_session, message_id)
-            
+
+            if feedback_count >= self.feedback_threshold:
+                logger.info(f"🎯 Threshold de feedback atingido para mensagem {message_id}")
+
             return feedback_id
-            
+
         except Exception as e:
             await db_session.rollback()
             logger.error(f"❌ Erro ao salvar feedback: {e}", exc_info=True)
             raise
 
-    async def _check_learning_trigger(self, db_session: AsyncSession, message_id: str):
-        """Verificar se deve disparar processo de aprendizado"""
-        try:
-            # Contar feedbacks para esta mensagem
-            result = await db_session.execute(text("""
-                SELECT COUNT(*) FROM feedback WHERE message_id = :message_id
-            """), {"message_id": message_id})
-            
-            feedback_count = result.fetchone()[0]
-            
-            if feedback_count >= self.feedback_threshold:
-                logger.info(f"🎯 Threshold de feedback atingido para mensagem {message_id}")
-                # TODO: Disparar tarefa Celery para aprendizado
-                await self._trigger_learning_session(db_session, message_id)
-                
-        except Exception as e:
-            logger.error(f"❌ Erro ao verificar trigger de aprendizado: {e}", exc_info=True)
+    async def start_feedback_listener(self):
+        """Iniciar o consumidor LISTEN/NOTIFY do canal feedback_threshold
 
-    async def _trigger_learning_session(self, db_session: AsyncSession, message_id: str):
-        """Disparar sessão de aprendizado baseada em feedback"""
+        Usa uma conexão asyncpg dedicada (fora do pool): o NOTIFY emitido
+        pelo CTE de save_feedback chega aqui após o commit e o disparo da
+        sessão de aprendizado acontece fora do caminho da requisição.
+        """
         try:
-            session_id = str(uuid.uuid4())
-            
-            # Criar sessão de aprendizado
-            await db_session.execute(text("""
-                INSERT INTO learning_sessions (id, session_type, status, input_data)
-                VALUES (:id, 'feedback_analysis', 'pending', :input_data)
-            """), {
-                "id": session_id,
-                "input_data": json.dumps({"message_id": message_id})
-            })
-            
-            await db_session.commit()
-            
-            logger.info(f"🧠 Sessão de aprendizado criada: {session_id}")
-            
-            # TODO: Enviar para fila Celery
-            # celery_app.send_task('process_feedback_learning', args=[session_id])
-            
+            from backend.database.connection import DATABASE_URL
+
+            dsn = DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+            self._listener_conn = await asyncpg.connect(dsn)
+            await self._listener_conn.add_listener(
+                "feedback_threshold", self._on_feedback_threshold
+            )
+
+            logger.info("👂 Listener de threshold de feedback iniciado")
+
         except Exception as e:
-            logger.error(f"❌ Erro ao criar sessão de aprendizado: {e}", exc_info=True)
+            logger.error(f"❌ Erro ao iniciar listener de feedback: {e}", exc_info=True)
+
+    async def stop_feedback_listener(self):
+        """Encerrar o consumidor LISTEN/NOTIFY"""
+        if self._listener_conn is not None:
+            try:
+                await self._listener_conn.close()
+            except Exception as e:
+                logger.warning(f"⚠️ Erro ao encerrar listener de feedback: {e}")
+            finally:
+                self._listener_conn = None
+
+    def _on_feedback_threshold(self, connection, pid, channel, payload):
+        """Callback síncrono do asyncpg: agendar processamento assíncrono"""
+        asyncio.get_running_loop().create_task(
+            self._handle_feedback_threshold(payload)
+        )
+
+    async def _handle_feedback_threshold(self, session_id: str):
+        """Processar notificação de sessão de aprendizado pendente
+
+        A sessão já foi criada pelo CTE de save_feedback, no mesmo commit
+        do feedback; aqui só resta despachar o processamento.
+        """
+        logger.info(f"🧠 Sessão de aprendizado pendente: {session_id}")
+
+        # TODO: Enviar para fila Celery
+        # celery_app.send_task('process_feedback_learning', args=[session_id])
 
     async def get_feedback_analysis(
         self,
         db_session: AsyncSession,
         days: int = 7
+    ) -> Dict[str, Any]:
+        """Obter análise de feedback dos últimos dias (cache Redis de 5 min)"""
+        ttl = 300
+        return await cached(
+            f"fb_an:{days}:{time_bucket(ttl)}", ttl,
+            lambda: self._get_feedback_analysis_uncached(db_session, days)
+        )
+
+    async def _get_feedback_analysis_uncached(
+        self,
+        db_session: AsyncSession,
+        days: int = 7
     ) -> Dict[str, Any]:
         """Obter análise de feedback dos últimos dias"""
         try:
-            since_date = datetime.now() - timedelta(days=days)
-            
-            # Estatísticas gerais de feedback
-            result = await db_session.execute(text("""
-                SELECT 
-                    COUNT(*) as total_feedback,
-                    AVG(rating) as avg_rating,
-                    COUNT(CASE WHEN rating >= 4 THEN 1 END) as positive_feedback,
-                    COUNT(CASE WHEN rating <= 2 THEN 1 END) as negative_feedback,
-                    COUNT(CASE WHEN comment IS NOT NULL THEN 1 END) as with_comments
-                FROM feedback 
-                WHERE created_at >= :since_date
-            """), {"since_date": since_date})
-            
-            stats = result.fetchone()
-            
-            # Feedback por categoria
-            result = await db_session.execute(text("""
-                SELECT 
-                    feedback_type,
-                    COUNT(*) as count,
-                    AVG(rating) as avg_rating
-                FROM feedback 
-                WHERE created_at >= :since_date
-                GROUP BY feedback_type
-                ORDER BY count DESC
-            """), {"since_date": since_date})
-            
-            categories = [
-                {
-                    "type": row[0],
-                    "count": row[1],
-                    "avg_rating": float(row[2]) if row[2] else 0
-                }
-                for row in result.fetchall()
-            ]
-            
-            # Comentários negativos recentes
-            result = await db_session.execute(text("""
-                SELECT comment, rating, created_at
-                FROM feedback 
-                WHERE created_at >= :since_date 
-                AND rating <= 2 
-                AND comment IS NOT NULL
-                ORDER BY created_at DESC
-                LIMIT 10
-            """), {"since_date": since_date})
-            
-            negative_comments = [
-                {
-                    "comment": row[0],
-                    "rating": row[1],
-                    "created_at": row[2].isoformat()
-                }
-                for row in result.fetchall()
-            ]
-            
-            return {
-                "period_days": days,
-                "total_feedback": stats[0] if stats else 0,
-                "average_rating": float(stats[1]) if stats and stats[1] else 0,
-                "positive_feedback": stats[2] if stats else 0,
-                "negative_feedback": stats[3] if stats else 0,
-                "feedback_with_comments": stats[4] if stats else 0,
-                "categories": categories,
-                "recent_negative_comments": negative_comments
-            }
-            
+            # Resposta inteira montada pelo PG via jsonb_build_object em uma
+            # única ida ao banco; na janela padrão de 7 dias os agregados
+            # vêm das views materializadas e só os comentários negativos
+            # recentes são lidos ao vivo
+            sql = _SQL_FEEDBACK_ANALYSIS_MV if days == 7 else _SQL_FEEDBACK_ANALYSIS_LIVE
+            result = await db_session.execute(sql, {"days": days})
+
+            row = result.fetchone()
+            if not row or row[0] is None:
+                return {}
+
+            analysis = row[0]
+            if isinstance(analysis, str):
+                analysis = json.loads(analysis)
+
+            return analysis
+
         except Exception as e:
             logger.error(f"❌ Erro ao analisar feedback: {e}", exc_info=True)
             return {}
@@ -193,70 +321,57 @@ class FeedbackService:
     async def get_improvement_suggestions(
         self,
         db_session: AsyncSession
+    ) -> List[str]:
+        """Gerar sugestões de melhoria baseadas no feedback (cache de 10 min)"""
+        ttl = 600
+        return await cached(
+            f"fb_sugg:{time_bucket(ttl)}", ttl,
+            lambda: self._get_improvement_suggestions_uncached(db_session)
+        )
+
+    async def _get_improvement_suggestions_uncached(
+        self,
+        db_session: AsyncSession
     ) -> List[str]:
         """Gerar sugestões de melhoria baseadas no feedback"""
         try:
             suggestions = []
-            
-            # Analisar feedback negativo
-            result = await db_session.execute(text("""
-                SELECT comment, rating
-                FROM feedback 
-                WHERE rating <= 2 
-                AND comment IS NOT NULL
-                AND created_at >= CURRENT_DATE - INTERVAL '7 days'
-                ORDER BY created_at DESC
-                LIMIT 20
-            """))
-            
-            negative_feedback = result.fetchall()
-            
-            if len(negative_feedback) > 5:
+
+            # Classificação dos comentários negativos feita no próprio PG
+            # (regex por categoria) junto com a taxa de positivos: uma única
+            # consulta de resumo em vez de transferir os comentários e
+            # escanear palavra a palavra em Python
+            result = await db_session.execute(_SQL_IMPROVEMENT_SUMMARY)
+
+            stats = result.fetchone()
+            if not stats:
+                return suggestions
+
+            total_negative, performance_count, accuracy_count, clarity_count, positive_rate = stats
+
+            if total_negative > 5:
                 suggestions.append(
-                    f"Alto volume de feedback negativo ({len(negative_feedback)} nos últimos 7 dias). "
+                    f"Alto volume de feedback negativo ({total_negative} nos últimos 7 dias). "
                     "Revisar qualidade das respostas."
                 )
-            
-            # Analisar padrões nos comentários
-            common_issues = {}
-            for comment, rating in negative_feedback:
-                if comment:
-                    # Análise simples de palavras-chave
-                    comment_lower = comment.lower()
-                    if any(word in comment_lower for word in ['lento', 'devagar', 'demora']):
-                        common_issues['performance'] = common_issues.get('performance', 0) + 1
-                    if any(word in comment_lower for word in ['errado', 'incorreto', 'erro']):
-                        common_issues['accuracy'] = common_issues.get('accuracy', 0) + 1
-                    if any(word in comment_lower for word in ['confuso', 'não entendi', 'unclear']):
-                        common_issues['clarity'] = common_issues.get('clarity', 0) + 1
-            
+
             # Gerar sugestões baseadas nos problemas identificados
-            for issue, count in common_issues.items():
-                if count >= 3:
-                    if issue == 'performance':
-                        suggestions.append("Otimizar tempo de resposta do sistema")
-                    elif issue == 'accuracy':
-                        suggestions.append("Melhorar precisão das respostas através de treinamento adicional")
-                    elif issue == 'clarity':
-                        suggestions.append("Aprimorar clareza e estrutura das respostas")
-            
+            if performance_count >= 3:
+                suggestions.append("Otimizar tempo de resposta do sistema")
+            if accuracy_count >= 3:
+                suggestions.append("Melhorar precisão das respostas através de treinamento adicional")
+            if clarity_count >= 3:
+                suggestions.append("Aprimorar clareza e estrutura das respostas")
+
             # Verificar taxa de feedback positivo
-            result = await db_session.execute(text("""
-                SELECT 
-                    COUNT(CASE WHEN rating >= 4 THEN 1 END) * 100.0 / COUNT(*) as positive_rate
-                FROM feedback 
-                WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
-            """))
-            
-            positive_rate = result.fetchone()
-            if positive_rate and positive_rate[0] and positive_rate[0] < 70:
+            if positive_rate and positive_rate < 70:
                 suggestions.append(
-                    f"Taxa de feedback positivo baixa ({positive_rate[0]:.1f}%). "
+                    f"Taxa de feedback positivo baixa ({positive_rate:.1f}%). "
                     "Considerar ajustes no modelo ou prompts."
                 )
-            
+
             return suggestions
-            
+
         except Exception as e:
             logger.error(f"❌ Erro ao gerar sugestões: {e}", exc_info=True)
             return ["Erro ao analisar feedback para sugestões"]
@@ -270,21 +385,16 @@ class FeedbackService:
         try:
             if not feedback_ids:
                 return
-            
-            placeholders = ','.join([f':id_{i}' for i in range(len(feedback_ids))])
-            params = {f'id_{i}': feedback_id for i, feedback_id in enumerate(feedback_ids)}
-            
-            await db_session.execute(text(f"""
-                UPDATE feedback 
-                SET processed = true 
-                WHERE id IN ({placeholders})
-            """), params)
-            
+
+            # Array nativo do PG em um único bind: SQL estável (aproveita o
+            # cache de prepared statements) independentemente do tamanho do lote
+            await db_session.execute(_SQL_MARK_PROCESSED, {"ids": feedback_ids})
+
             await db_session.commit()
-            
+
             logger.info(f"✅ {len(feedback_ids)} feedbacks marcados como processados")
-            
+
         except Exception as e:
             await db_session.rollback()
             logger.error(f"❌ Erro ao marcar feedbacks como processados: {e}", exc_info=True)
-            raise
\ No newline at end of file
+            raise
@@ -5,12 +5,121 @@ Sistema de IA Conversacional Avançada
 
 import uuid
 import json
-from typing import Optional, List, Dict, Any
+import time
+from typing import Optional, List, Dict, Any, NamedTuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
-from datetime import datetime
+from sqlalchemy import text, insert, Table, Column, MetaData, String, Text, Float
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID as PG_UUID
 
 from app.logger import logger
+from backend.services.cache import cached, get_redis, time_bucket
+
+# Statements SQL construídos uma única vez no import: objetos text()
+# estáveis aproveitam o compiled cache do SQLAlchemy e o cache de
+# prepared statements do asyncpg
+_SQL_INSERT_KNOWLEDGE = text("""
+    INSERT INTO knowledge_base
+    (id, title, content, category, tags, source, confidence_score, chromadb_id, metadata)
+    VALUES (:id, :title, :content, :category, :tags, :source, :confidence_score, :chromadb_id, :metadata)
+""")
+
+# Definição Core mínima da tabela para o caminho de lote pequeno: com
+# insert() + lista de parâmetros o SQLAlchemy 2.0 emite um único
+# INSERT ... VALUES (...), (...), ... (insertmanyvalues) em vez de N
+# statements individuais
+_KNOWLEDGE_TABLE = Table(
+    "knowledge_base", MetaData(),
+    Column("id", PG_UUID(as_uuid=False), primary_key=True),
+    Column("title", String(255)),
+    Column("content", Text),
+    Column("category", String(100)),
+    Column("tags", ARRAY(Text)),
+    Column("source", String(255)),
+    Column("confidence_score", Float),
+    Column("chromadb_id", PG_UUID(as_uuid=False)),
+    Column("metadata", JSONB),
+)
+
+_INSERT_KNOWLEDGE_MANY = insert(_KNOWLEDGE_TABLE)
+
+# Linhas das estatísticas como NamedTuple: construção via _make(row) é
+# mais barata que montar dicts campo a campo no loop quente
+class _CategoryRow(NamedTuple):
+    category: Optional[str]
+    count: int
+    avg_confidence: float
+
+class _MostUsedRow(NamedTuple):
+    title: str
+    usage_count: int
+    last_used_at: Optional[str]
+
+_SQL_GET_KNOWLEDGE = text("""
+    UPDATE knowledge_base
+    SET usage_count = usage_count + 1, last_used_at = CURRENT_TIMESTAMP
+    WHERE id = :knowledge_id
+    RETURNING id, title, content, category, tags, source, confidence_score,
+              usage_count, last_used_at, created_at, updated_at, metadata
+""")
+
+_SQL_GET_KNOWLEDGE_RO = text("""
+    SELECT id, title, content, category, tags, source, confidence_score,
+           usage_count, last_used_at, created_at, updated_at, metadata
+    FROM knowledge_base
+    WHERE id = :knowledge_id
+""")
+
+# Word similarity (<%), não similaridade de string inteira (%): esta
+# normaliza pela união dos trigramas dos dois lados, então uma consulta
+# curta contra um content de vários KB pontua ~0 e nunca passa do
+# threshold. word_similarity compara a consulta com o melhor trecho do
+# content, e o índice GIN gin_trgm_ops acelera o operador do mesmo jeito
+_SQL_SEARCH_CONTEXT = text("""
+    SELECT title, substring(content for 500) AS excerpt, category
+    FROM knowledge_base
+    WHERE :query <% content
+    ORDER BY word_similarity(:query, content) DESC, confidence_score DESC, usage_count DESC
+    LIMIT :limit
+""")
+
+_SQL_SEARCH_CONTEXT_BY_CATEGORY = text("""
+    SELECT title, substring(content for 500) AS excerpt, category
+    FROM knowledge_base
+    WHERE :query <% content AND category = :category
+    ORDER BY word_similarity(:query, content) DESC, confidence_score DESC, usage_count DESC
+    LIMIT :limit
+""")
+
+_SQL_KNOWLEDGE_STATS_MV = text("""
+    SELECT total_items, categories_count, avg_confidence,
+           total_usage, last_added
+    FROM mv_knowledge_stats
+""")
+
+_SQL_KNOWLEDGE_CATEGORIES_MV = text("""
+    SELECT category, count, avg_confidence
+    FROM mv_knowledge_category_counts
+    ORDER BY count DESC
+""")
+
+_SQL_KNOWLEDGE_MOST_USED_MV = text("""
+    SELECT title, usage_count, last_used_at
+    FROM mv_knowledge_most_used
+    ORDER BY usage_count DESC
+""")
+
+_SQL_STALE_KNOWLEDGE = text("""
+    SELECT id, title
+    FROM knowledge_base
+    WHERE (last_used_at IS NULL OR last_used_at < now() - make_interval(days => :days))
+    AND usage_count < 5
+    AND confidence_score < 0.5
+    AND source != 'admin_input'
+""")
+
+_SQL_DELETE_KNOWLEDGE = text("""
+    DELETE FROM knowledge_base WHERE id = ANY(CAST(:ids AS uuid[]))
+""")
 
 class KnowledgeService:
     """Serviço para gerenciar a base de conhecimento do sistema"""
@@ -35,11 +144,7 @@ class KnowledgeService:
             chromadb_id = str(uuid.uuid4())
             
             # Inserir no PostgreSQL
-            await db_session.execute(text("""
-                INSERT INTO knowledge_base 
-                (id, title, content, category, tags, source, confidence_score, chromadb_id, metadata)
-                VALUES (:id, :title, :content, :category, :tags, :source, :confidence_score, :chromadb_id, :metadata)
-            """), {
+            await db_session.execute(_SQL_INSERT_KNOWLEDGE, {
                 "id": knowledge_id,
                 "title": title,
                 "content": content,
@@ -48,11 +153,8 @@ class KnowledgeService:
                 "source": source,
                 "confidence_score": confidence_score,
                 "chromadb_id": chromadb_id,
-                "metadata": json.dumps({
-                    "created_by": "system",
-                    "content_length": len(content),
-                    "word_count": len(content.split())
-                })
+                # content_length/word_count agora são colunas geradas pelo PG
+                "metadata": json.dumps({"created_by": "system"})
             })
             
             await db_session.commit()
@@ -69,6 +171,82 @@ class KnowledgeService:
             logger.error(f"❌ Erro ao adicionar conhecimento: {e}", exc_info=True)
             raise
 
+    # Tamanho de lote a partir do qual o caminho COPY compensa
+    COPY_BATCH_THRESHOLD = 100
+
+    async def add_knowledge_items_bulk(
+        self,
+        db_session: AsyncSession,
+        items: List[Dict[str, Any]]
+    ) -> List[str]:
+        """Adicionar itens em lote à base de conhecimento
+
+        Lotes grandes usam COPY nativo do asyncpg (uma única mensagem de
+        protocolo); lotes pequenos caem em um executemany.
+        """
+        if not items:
+            return []
+
+        try:
+            knowledge_ids = [str(uuid.uuid4()) for _ in items]
+            chromadb_ids = [str(uuid.uuid4()) for _ in items]
+
+            # content_length/word_count agora são colunas geradas pelo PG
+            metadata = json.dumps({"created_by": "system"})
+
+            if len(items) >= self.COPY_BATCH_THRESHOLD:
+                records = [
+                    (
+                        knowledge_id,
+                        item["title"],
+                        item["content"],
+                        item.get("category"),
+                        item.get("tags") or [],
+                        item.get("source", "api"),
+                        item.get("confidence_score", 1.0),
+                        chromadb_id,
+                        metadata
+                    )
+                    for item, knowledge_id, chromadb_id in zip(items, knowledge_ids, chromadb_ids)
+                ]
+
+                conn = await db_session.connection()
+                raw_connection = await conn.get_raw_connection()
+                await raw_connection.driver_connection.copy_records_to_table(
+                    "knowledge_base",
+                    records=records,
+                    columns=[
+                        "id", "title", "content", "category", "tags",
+                        "source", "confidence_score", "chromadb_id", "metadata"
+                    ]
+                )
+            else:
+                await db_session.execute(_INSERT_KNOWLEDGE_MANY, [
+                    {
+                        "id": knowledge_id,
+                        "title": item["title"],
+                        "content": item["content"],
+                        "category": item.get("category"),
+                        "tags": item.get("tags") or [],
+                        "source": item.get("source", "api"),
+                        "confidence_score": item.get("confidence_score", 1.0),
+                        "chromadb_id": chromadb_id,
+                        "metadata": {"created_by": "system"}
+                    }
+                    for item, knowledge_id, chromadb_id in zip(items, knowledge_ids, chromadb_ids)
+                ])
+
+            await db_session.commit()
+
+            logger.info(f"📚 {len(items)} conhecimentos adicionados em lote")
+
+            return knowledge_ids
+
+        except Exception as e:
+            await db_session.rollback()
+            logger.error(f"❌ Erro ao adicionar conhecimentos em lote: {e}", exc_info=True)
+            raise
+
     async def get_knowledge_item(
         self,
         db_session: AsyncSession,
@@ -76,87 +254,93 @@ class KnowledgeService:
     ) -> Optional[Dict[str, Any]]:
         """Recuperar item específico da base de conhecimento"""
         try:
-            result = await db_session.execute(text("""
-                SELECT id, title, content, category, tags, source, confidence_score,
-                       usage_count, last_used_at, created_at, updated_at, metadata
-                FROM knowledge_base 
-                WHERE id = :knowledge_id
-            """), {"knowledge_id": knowledge_id})
-            
+            # Caminho quente: contador de uso diferido no Redis (drenado em
+            # lote pelo Celery beat) e leitura sem UPDATE — remove o fsync
+            # do commit do caminho de leitura
+            client = get_redis()
+            if client is not None:
+                try:
+                    await client.hincrby("kb:usage", knowledge_id, 1)
+                    await client.hset("kb:last_used", knowledge_id, time.time())
+
+                    result = await db_session.execute(
+                        _SQL_GET_KNOWLEDGE_RO, {"knowledge_id": knowledge_id}
+                    )
+                    row = result.fetchone()
+                    return self._format_item(row) if row else None
+
+                except Exception as e:
+                    logger.warning(f"⚠️ Contador de uso via Redis indisponível: {e}")
+
+            # Fallback sem Redis: SELECT + incremento fundidos em um único
+            # UPDATE ... RETURNING (uma ida ao banco, sem janela de corrida)
+            result = await db_session.execute(_SQL_GET_KNOWLEDGE, {"knowledge_id": knowledge_id})
+
             row = result.fetchone()
             if not row:
                 return None
-            
-            # Incrementar contador de uso
-            await db_session.execute(text("""
-                UPDATE knowledge_base 
-                SET usage_count = usage_count + 1, last_used_at = CURRENT_TIMESTAMP
-                WHERE id = :knowledge_id
-            """), {"knowledge_id": knowledge_id})
-            
+
             await db_session.commit()
-            
-            return {
-                "id": row[0],
-                "title": row[1],
-                "content": row[2],
-                "category": row[3],
-                "tags": row[4],
-                "source": row[5],
-                "confidence_score": float(row[6]) if row[6] else 0,
-                "usage_count": row[7],
-                "last_used_at": row[8].isoformat() if row[8] else None,
-                "created_at": row[9].isoformat(),
-                "updated_at": row[10].isoformat(),
-                "metadata": row[11] if row[11] else {}
-            }
-            
+
+            return self._format_item(row)
+
         except Exception as e:
             logger.error(f"❌ Erro ao recuperar conhecimento: {e}", exc_info=True)
             return None
 
+    @staticmethod
+    def _format_item(row) -> Dict[str, Any]:
+        """Converter linha do banco no dicionário público do item"""
+        return {
+            "id": row[0],
+            "title": row[1],
+            "content": row[2],
+            "category": row[3],
+            "tags": row[4],
+            "source": row[5],
+            "confidence_score": float(row[6]) if row[6] else 0,
+            "usage_count": row[7],
+            "last_used_at": row[8].isoformat() if row[8] else None,
+            "created_at": row[9].isoformat(),
+            "updated_at": row[10].isoformat(),
+            "metadata": row[11] if row[11] else {}
+        }
+
     async def search_relevant_context(
         self,
+        db_session: AsyncSession,
         query: str,
         limit: int = 5,
         category: Optional[str] = None
     ) -> str:
         """Buscar contexto relevante na base de conhecimento"""
         try:
-            # TODO: Implementar busca semântica real com ChromaDB
-            # Por enquanto, busca textual simples
-            
-            # Construir query SQL com filtros
-            where_clause = "WHERE content ILIKE :query"
-            params = {"query": f"%{query}%", "limit": limit}
-            
+            # TODO: Implementar busca semântica real com ChromaDB (ANN sobre embeddings)
+            # Busca lexical via trigram (pg_trgm): o operador % usa o índice
+            # GIN idx_knowledge_content_trgm em vez de um seq scan com ILIKE
+            params = {"query": query, "limit": limit}
+
             if category:
-                where_clause += " AND category = :category"
+                sql_query = _SQL_SEARCH_CONTEXT_BY_CATEGORY
                 params["category"] = category
-            
-            # Buscar itens relevantes
-            sql_query = f"""
-                SELECT title, content, category, confidence_score, usage_count
-                FROM knowledge_base 
-                {where_clause}
-                ORDER BY confidence_score DESC, usage_count DESC
-                LIMIT :limit
-            """
-            
-            # Usar uma nova sessão para esta consulta
-            from backend.database.connection import AsyncSessionLocal
-            async with AsyncSessionLocal() as session:
-                result = await session.execute(text(sql_query), params)
-                rows = result.fetchall()
+            else:
+                sql_query = _SQL_SEARCH_CONTEXT
+
+            # Reutilizar a sessão do chamador em vez de abrir um checkout
+            # extra de conexão por busca (contenção no pool sob carga)
+            result = await db_session.execute(sql_query, params)
+            rows = result.fetchall()
             
             if not rows:
                 return ""
             
             # Formatar contexto
+            # O recorte de 500 caracteres já vem do SQL (substring): evita
+            # transferir o conteúdo completo de itens grandes pela rede
             context_parts = []
             for row in rows:
-                title, content, category, confidence, usage = row
-                context_parts.append(f"**{title}** ({category or 'Geral'}):\n{content[:500]}...")
+                title, excerpt, category = row
+                context_parts.append(f"**{title}** ({category or 'Geral'}):\n{excerpt}...")
             
             context = "\n\n".join(context_parts)
             logger.info(f"🔍 Contexto relevante encontrado: {len(rows)} itens")
@@ -197,57 +381,39 @@ class KnowledgeService:
     async def get_knowledge_stats(
         self,
         db_session: AsyncSession
+    ) -> Dict[str, Any]:
+        """Obter estatísticas da base de conhecimento (cache Redis de 5 min)"""
+        ttl = 300
+        return await cached(
+            f"kb_stats:{time_bucket(ttl)}", ttl,
+            lambda: self._get_knowledge_stats_uncached(db_session)
+        )
+
+    async def _get_knowledge_stats_uncached(
+        self,
+        db_session: AsyncSession
     ) -> Dict[str, Any]:
         """Obter estatísticas da base de conhecimento"""
         try:
-            # Estatísticas gerais
-            result = await db_session.execute(text("""
-                SELECT 
-                    COUNT(*) as total_items,
-                    COUNT(DISTINCT category) as categories_count,
-                    AVG(confidence_score) as avg_confidence,
-                    SUM(usage_count) as total_usage,
-                    MAX(created_at) as last_added
-                FROM knowledge_base
-            """))
-            
+            # Estatísticas gerais (pré-agregadas em view materializada,
+            # atualizada periodicamente pelo Celery beat)
+            result = await db_session.execute(_SQL_KNOWLEDGE_STATS_MV)
+
             stats = result.fetchone()
-            
+
             # Itens por categoria
-            result = await db_session.execute(text("""
-                SELECT 
-                    COALESCE(category, 'Sem Categoria') as category,
-                    COUNT(*) as count,
-                    AVG(confidence_score) as avg_confidence
-                FROM knowledge_base
-                GROUP BY category
-                ORDER BY count DESC
-            """))
-            
+            result = await db_session.execute(_SQL_KNOWLEDGE_CATEGORIES_MV)
+
             categories = [
-                {
-                    "category": row[0],
-                    "count": row[1],
-                    "avg_confidence": float(row[2]) if row[2] else 0
-                }
+                _CategoryRow(row[0], row[1], float(row[2]) if row[2] else 0)._asdict()
                 for row in result.fetchall()
             ]
-            
+
             # Itens mais utilizados
-            result = await db_session.execute(text("""
-                SELECT title, usage_count, last_used_at
-                FROM knowledge_base
-                WHERE usage_count > 0
-                ORDER BY usage_count DESC
-                LIMIT 10
-            """))
-            
+            result = await db_session.execute(_SQL_KNOWLEDGE_MOST_USED_MV)
+
             most_used = [
-                {
-                    "title": row[0],
-                    "usage_count": row[1],
-                    "last_used_at": row[2].isoformat() if row[2] else None
-                }
+                _MostUsedRow(row[0], row[1], row[2].isoformat() if row[2] else None)._asdict()
                 for row in result.fetchall()
             ]
             
@@ -272,30 +438,17 @@ class KnowledgeService:
     ):
         """Limpar conhecimento antigo e pouco utilizado"""
         try:
-            cutoff_date = datetime.now() - timedelta(days=days_threshold)
-            
-            # Identificar itens para limpeza
-            result = await db_session.execute(text("""
-                SELECT id, title
-                FROM knowledge_base
-                WHERE (last_used_at IS NULL OR last_used_at < :cutoff_date)
-                AND usage_count < 5
-                AND confidence_score < 0.5
-                AND source != 'admin_input'
-            """), {"cutoff_date": cutoff_date})
+            # Identificar itens para limpeza (corte calculado no próprio PG)
+            result = await db_session.execute(_SQL_STALE_KNOWLEDGE, {"days": days_threshold})
             
             items_to_remove = result.fetchall()
             
             if items_to_remove:
-                # Remover itens identificados
+                # Remover itens identificados via array nativo do PG
                 item_ids = [item[0] for item in items_to_remove]
-                placeholders = ','.join([f':id_{i}' for i in range(len(item_ids))])
-                params = {f'id_{i}': item_id for i, item_id in enumerate(item_ids)}
-                
-                await db_session.execute(text(f"""
-                    DELETE FROM knowledge_base WHERE id IN ({placeholders})
-                """), params)
-                
+
+                await db_session.execute(_SQL_DELETE_KNOWLEDGE, {"ids": item_ids})
+
                 await db_session.commit()
                 
                 logger.info(f"🧹 Removidos {len(items_to_remove)} itens antigos da base de conhecimento")
@@ -3,16 +3,321 @@ Serviço de Aprendizado Avançado
 Sistema de IA Conversacional com Auto-Aprendizado
 """
 
-import json
+import re
 import uuid
+import hashlib
+import secrets
 import asyncio
-from typing import Dict, Any, List, Optional
+import orjson
+import numpy as np
+from cachetools import TTLCache
+from enum import IntEnum
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
 from app.logger import logger
 
+def _dumps(obj: Any) -> str:
+    """Serializar JSON com orjson (encoder nativo, bem mais rápido que o
+    stdlib nos caminhos quentes de insert/update)"""
+    return orjson.dumps(obj).decode()
+
+# Pool de UUIDs pré-gerados: amortiza a chamada ao RNG do SO sobre 64 ids
+# em vez de um syscall por uuid4() nos disparos em lote
+_UUID_POOL: List[uuid.UUID] = []
+
+def _next_uuid() -> str:
+    if not _UUID_POOL:
+        buf = secrets.token_bytes(16 * 64)
+        _UUID_POOL.extend(
+            uuid.UUID(bytes=buf[i:i + 16], version=4)
+            for i in range(0, len(buf), 16)
+        )
+    return str(_UUID_POOL.pop())
+
+# Scanners pré-compilados no import, com um grupo nomeado por categoria:
+# uma única passada pelo texto em vez de reconstruir listas de palavras e
+# fazer dezenas de buscas de substring (+ .lower()) a cada chamada
+_IMPROVEMENT_RE = re.compile(
+    r'(?P<performance>lento|devagar|demora)'
+    r'|(?P<accuracy>errado|incorreto|impreciso)'
+    r'|(?P<clarity>confuso|não entendi|vago)'
+    r'|(?P<completeness>incompleto|faltou)',
+    re.IGNORECASE
+)
+
+_IMPROVEMENT_AREAS = ('performance', 'accuracy', 'clarity', 'completeness')
+
+_NEGATIVE_PATTERN_RE = re.compile(
+    r'(?P<response_length>muito longo|extenso|prolixo)'
+    r'|(?P<technical_complexity>técnico|complexo|difícil)'
+    r'|(?P<technical_accuracy>impreciso|errado|incorreto)'
+    r'|(?P<response_depth>vago|genérico|superficial)',
+    re.IGNORECASE
+)
+
+_NEGATIVE_PATTERNS = (
+    'response_length', 'technical_complexity',
+    'technical_accuracy', 'response_depth'
+)
+
+# Termos técnicos para detecção de lacunas de conhecimento: uma passada do
+# autômato compilado em vez de 11 buscas de substring + .lower() do corpo
+# inteiro da resposta
+_TECH_RE = re.compile(
+    r'\b(python|javascript|api|database|sql|machine learning|ai'
+    r'|algoritmo|programação|desenvolvimento|sistema)\b',
+    re.IGNORECASE
+)
+
+# Consultas da análise abrangente — independentes entre si, executadas em
+# paralelo com asyncio.gather em sessões dedicadas (backends separados no
+# Postgres: o tempo total vira o máximo das três, não a soma)
+_SQL_ANALYSIS_PERF_TREND = text("""
+    SELECT
+        DATE(timestamp) as date,
+        AVG(metric_value) as avg_response_time,
+        COUNT(*) as request_count
+    FROM performance_metrics
+    WHERE metric_name = 'response_time'
+    AND timestamp >= CURRENT_DATE - INTERVAL '30 days'
+    GROUP BY date
+    ORDER BY date DESC
+    LIMIT 30
+""")
+
+_SQL_ANALYSIS_SAT_TREND = text("""
+    SELECT date, avg_rating, total_feedback as feedback_count
+    FROM feedback_daily_stats
+    WHERE date >= CURRENT_DATE - 30
+    ORDER BY date DESC
+    LIMIT 30
+""")
+
+# Demais consultas do serviço, pré-construídas no import: objetos text()
+# estáveis aproveitam o compiled cache do SQLAlchemy e o cache de prepared
+# statements do asyncpg (sem re-parse por chamada)
+_SQL_FEEDBACK_DETAIL = text("""
+    SELECT f.message_id, f.conversation_id, m.content as message_content
+    FROM feedback f
+    JOIN messages m ON f.message_id = m.id
+    WHERE f.id = :feedback_id
+""")
+
+_SQL_FEEDBACK_BATCH = text("""
+    SELECT f.id, f.rating, f.comment, f.message_id, f.conversation_id,
+           m.content as message_content
+    FROM feedback f
+    JOIN messages m ON f.message_id = m.id
+    WHERE f.id = ANY(CAST(:ids AS uuid[]))
+""")
+
+_SQL_INSERT_METRICS_MANY = text("""
+    INSERT INTO performance_metrics
+    (metric_name, metric_value, metric_type, labels, context)
+    VALUES (:name, :value, :type, :labels, :context)
+""")
+
+_SQL_FLAG_MESSAGES_BULK = text("""
+    UPDATE messages m
+    SET metadata = m.metadata || v.flag
+    FROM (
+        SELECT unnest(CAST(:mids AS uuid[])) AS message_id,
+               unnest(CAST(:flags AS jsonb[])) AS flag
+    ) v
+    WHERE m.id = v.message_id
+""")
+
+_SQL_FLAG_MESSAGE_BY_CONV = text("""
+    UPDATE messages 
+    SET metadata = metadata || :flag
+    WHERE id = (
+        SELECT message_id FROM feedback WHERE conversation_id = :conv_id
+    )
+""")
+
+_SQL_FEEDBACK_STATS = text("""
+    SELECT COUNT(*), AVG(rating)
+    FROM feedback
+    WHERE message_id = :message_id
+""")
+
+_SQL_CREATE_OPTIMIZATION_SESSION = text("""
+    INSERT INTO learning_sessions (id, session_type, status, input_data)
+    VALUES (:id, 'model_optimization', 'pending', :input_data)
+""")
+
+_SQL_SESSION_MARK_RUNNING = text("""
+    UPDATE learning_sessions 
+    SET status = 'running', started_at = CURRENT_TIMESTAMP
+    WHERE id = :session_id
+""")
+
+# O envelope do resultado é montado no servidor: jsonb_build_object anexa o
+# session_id ao payload já em jsonb, então o Python serializa só o corpo do
+# resultado (sem repetir o id) e o merge acontece no formato binário
+_SQL_SESSION_MARK_DONE = text("""
+    UPDATE learning_sessions
+    SET status = :status, completed_at = CURRENT_TIMESTAMP,
+        output_data = jsonb_build_object('session_id', CAST(:session_id AS text))
+                      || CAST(:output AS jsonb)
+    WHERE id = :session_id
+""")
+
+_SQL_SESSION_MARK_FAILED = text("""
+    UPDATE learning_sessions 
+    SET status = 'failed', completed_at = CURRENT_TIMESTAMP, error_message = :error
+    WHERE id = :session_id
+""")
+
+_SQL_OPTIMIZATION_WINDOW_STATS = text("""
+    SELECT
+        SUM(avg_rating * total_feedback) / NULLIF(SUM(total_feedback), 0) as avg_rating,
+        COALESCE(SUM(total_feedback), 0) as total_feedback,
+        COALESCE(SUM(negative_count), 0) as negative_feedback,
+        COALESCE(SUM(positive_count), 0) as positive_feedback
+    FROM feedback_daily_stats
+    WHERE date >= CURRENT_DATE - 7
+""")
+
+_SQL_PROBLEMATIC_RESPONSES = text("""
+    SELECT 
+        m.content,
+        COUNT(f.id) as feedback_count,
+        AVG(f.rating) as avg_rating
+    FROM messages m
+    LEFT JOIN feedback f ON m.id = f.message_id
+    WHERE m.sender = 'assistant'
+    AND m.timestamp >= CURRENT_DATE - INTERVAL '14 days'
+    GROUP BY m.content
+    HAVING COUNT(f.id) >= 2 AND AVG(f.rating) <= 2.5
+    ORDER BY COUNT(f.id) DESC
+    LIMIT 10
+""")
+
+_SQL_LEARNING_SESSION_STATS = text("""
+    SELECT 
+        session_type,
+        COUNT(*) as total_sessions,
+        COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_sessions,
+        AVG(EXTRACT(EPOCH FROM (completed_at - started_at))) as avg_duration
+    FROM learning_sessions
+    WHERE started_at >= :since_date
+    GROUP BY session_type
+""")
+
+_SQL_KNOWLEDGE_EVOLUTION = text("""
+    SELECT 
+        DATE(created_at) as date,
+        COUNT(*) as new_items,
+        AVG(confidence_score) as avg_confidence
+    FROM knowledge_base
+    WHERE created_at >= :since_date
+    GROUP BY date
+    ORDER BY date
+""")
+
+# As quatro contagens das recomendações em um único round-trip: cada uma
+# devolve um escalar, então o custo dominante eram as três execuções
+# separadas (latência de rede e checkout de conexão), não as consultas.
+# String crua (sem binds) executada direto no asyncpg: para uma linha de
+# escalares, a compilação e o empacotamento de Row do SQLAlchemy custam
+# mais do que a própria consulta
+_RAW_RECOMMENDATION_STATS = ("""
+    SELECT
+        (SELECT COUNT(*)
+         FROM messages m
+         WHERE m.sender = 'assistant'
+         AND m.timestamp >= CURRENT_DATE - INTERVAL '7 days') as total_messages,
+        (SELECT COUNT(*)
+         FROM feedback f
+         JOIN messages m2 ON m2.id = f.message_id
+         WHERE m2.sender = 'assistant'
+         AND m2.timestamp >= CURRENT_DATE - INTERVAL '7 days') as total_feedback,
+        (SELECT COUNT(DISTINCT category)
+         FROM knowledge_base) as categories_count,
+        (SELECT COUNT(*)
+         FROM learning_sessions
+         WHERE started_at >= CURRENT_DATE - INTERVAL '7 days'
+         AND status = 'completed') as recent_sessions
+""")
+
+# Classificação dos comentários negativos no servidor: mesmos padrões de
+# _NEGATIVE_PATTERN_RE, mas como FILTERs — uma linha de contadores cruza a
+# rede em vez do texto de todos os comentários da semana
+_SQL_NEGATIVE_PATTERN_HITS = text("""
+    SELECT
+        COUNT(*) FILTER (WHERE comment ~* '(muito longo|extenso|prolixo)') as response_length,
+        COUNT(*) FILTER (WHERE comment ~* '(técnico|complexo|difícil)') as technical_complexity,
+        COUNT(*) FILTER (WHERE comment ~* '(impreciso|errado|incorreto)') as technical_accuracy,
+        COUNT(*) FILTER (WHERE comment ~* '(vago|genérico|superficial)') as response_depth
+    FROM feedback
+    WHERE rating <= 2
+    AND comment IS NOT NULL
+    AND created_at >= CURRENT_DATE - INTERVAL '7 days'
+""")
+
+_SQL_ANALYSIS_TOP_TOPICS = text("""
+    SELECT
+        kb.category,
+        COUNT(*) as usage_count,
+        AVG(kb.confidence_score) as avg_confidence
+    FROM knowledge_base kb
+    WHERE kb.last_used_at >= CURRENT_DATE - INTERVAL '30 days'
+    GROUP BY kb.category
+    ORDER BY usage_count DESC
+    LIMIT 10
+""")
+
+class InsightCode(IntEnum):
+    """Códigos estruturados dos insights do sistema
+
+    O texto em linguagem natural é só apresentação; as recomendações são
+    despachadas por tabela sobre o código, sem casar substrings em
+    mensagens traduzíveis.
+    """
+    PERF_DEGRADED = 1
+    PERF_EXCELLENT = 2
+    PERF_RISING = 3
+    SAT_HIGH = 4
+    SAT_LOW = 5
+    SAT_FALLING = 6
+    TOP_TOPIC = 7
+    LOW_CONFIDENCE = 8
+
+# Tabela código -> recomendação: lookup O(1) por insight
+_REC_TABLE = {
+    InsightCode.PERF_DEGRADED: "Otimizar infraestrutura ou modelo para melhorar tempo de resposta",
+    InsightCode.PERF_RISING: "Investigar causa do aumento gradual do tempo de resposta",
+    InsightCode.SAT_LOW: "Revisar prompts do sistema e qualidade das respostas",
+    InsightCode.SAT_FALLING: "Revisar mudanças recentes que afetaram a satisfação",
+    InsightCode.LOW_CONFIDENCE: "Expandir base de conhecimento em tópicos com baixa confiança",
+    InsightCode.SAT_HIGH: "Documentar estratégias atuais como melhores práticas",
+}
+
+class _VersionedMetrics(dict):
+    """Dict de métricas com versão: snapshot() só realoca a cópia quando
+    algum contador mudou desde a última serialização — chamadas repetidas
+    da API reutilizam o mesmo dict"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+        self._snapshot_version = -1
+        self._snapshot: Dict[str, Any] = {}
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        if self._snapshot_version != self.version:
+            self._snapshot = dict(self)
+            self._snapshot_version = self.version
+        return self._snapshot
+
 class LearningService:
     """Serviço responsável pelo auto-aprendizado e evolução contínua do sistema"""
     
@@ -28,12 +333,28 @@ class LearningService:
         self.confidence_threshold = 0.7
         
         # Métricas de aprendizado
-        self.learning_metrics = {
+        self.learning_metrics = _VersionedMetrics({
             "total_sessions": 0,
             "successful_optimizations": 0,
             "knowledge_items_created": 0,
             "model_adjustments": 0
-        }
+        })
+
+        # Memoização das lacunas de conhecimento: respostas parecidas se
+        # repetem entre sessões, e o resultado da classificação vale por
+        # uma hora
+        self._gap_cache: TTLCache = TTLCache(maxsize=4096, ttl=3600)
+        self._gap_cache_lock = asyncio.Lock()
+        self._gap_cache_hits = 0
+        self._gap_cache_misses = 0
+
+        # Fila limitada de sessões de aprendizado: um número fixo de
+        # workers consome os disparos, limitando conexões e chamadas ao
+        # modelo sob tempestades de feedback (em vez de um create_task
+        # solto por trigger). Workers são criados no primeiro disparo,
+        # já dentro do event loop.
+        self._learning_queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+        self._learning_workers: List[asyncio.Task] = []
     
     async def process_feedback_for_learning(
         self, 
@@ -47,12 +368,7 @@ class LearningService:
             
             async with self.database_service.session_factory() as session:
                 # Obter detalhes do feedback
-                result = await session.execute(text("""
-                    SELECT f.message_id, f.conversation_id, m.content as message_content
-                    FROM feedback f
-                    JOIN messages m ON f.message_id = m.id
-                    WHERE f.id = :feedback_id
-                """), {"feedback_id": feedback_id})
+                result = await session.execute(_SQL_FEEDBACK_DETAIL, {"feedback_id": feedback_id})
                 
                 feedback_data = result.fetchone()
                 if not feedback_data:
@@ -60,7 +376,14 @@ class LearningService:
                     return
                 
                 message_id, conversation_id, message_content = feedback_data
-                
+
+                # Disparar a consulta de estatísticas do trigger em paralelo
+                # (sessão dedicada do pool): a latência dela fica escondida
+                # atrás do processamento positivo/negativo em andamento
+                trigger_task = asyncio.create_task(
+                    self._query_feedback_stats(message_id)
+                )
+
                 # Analisar tipo de feedback
                 if rating >= 4:
                     await self._process_positive_feedback(
@@ -70,15 +393,111 @@ class LearningService:
                     await self._process_negative_feedback(
                         session, message_content, comment, conversation_id
                     )
-                
+
                 # Verificar se deve disparar otimização do modelo
-                await self._check_model_optimization_trigger(session, message_id)
-                
+                count, avg_rating = await trigger_task
+                await self._check_model_optimization_trigger(
+                    session, message_id, count, avg_rating
+                )
+
                 logger.info(f"✅ Feedback {feedback_id} processado")
                 
         except Exception as e:
             logger.error(f"❌ Erro ao processar feedback: {e}", exc_info=True)
     
+    async def process_feedback_batch(self, feedback_ids: List[str]):
+        """Processar um lote de feedbacks para aprendizado
+
+        Um SELECT com ANY(:ids) e inserções acumuladas em lote: o custo de
+        rede é amortizado sobre o lote inteiro em vez de uma ida ao banco
+        por feedback.
+        """
+        if not feedback_ids:
+            return
+
+        try:
+            logger.info(f"🧠 Processando lote de {len(feedback_ids)} feedbacks para aprendizado...")
+
+            async with self.database_service.session_factory() as session:
+                result = await session.execute(_SQL_FEEDBACK_BATCH, {"ids": feedback_ids})
+
+                rows = result.fetchall()
+                if not rows:
+                    return
+
+                knowledge_items = []
+                metric_rows = []
+                flag_mids = []
+                flag_jsons = []
+                today = datetime.now().strftime('%d/%m/%Y')
+
+                for _, rating, comment, message_id, conversation_id, message_content in rows:
+                    if rating >= 4:
+                        if len(message_content) > 100:
+                            knowledge_items.append({
+                                "title": f"Resposta bem avaliada - {today}",
+                                "content": message_content,
+                                "category": "respostas_positivas",
+                                "source": "feedback_positivo",
+                                "confidence_score": 0.9
+                            })
+                        if comment and len(comment) > 20:
+                            knowledge_items.append({
+                                "title": f"Insight do usuário - {today}",
+                                "content": comment,
+                                "category": "insights_usuarios",
+                                "source": "comentario_positivo",
+                                "confidence_score": 0.8
+                            })
+
+                    elif rating <= 2:
+                        matched = (
+                            {m.lastgroup for m in _IMPROVEMENT_RE.finditer(comment)}
+                            if comment else set()
+                        )
+                        improvement_areas = [a for a in _IMPROVEMENT_AREAS if a in matched]
+
+                        for area in improvement_areas:
+                            metric_rows.append({
+                                "name": f"improvement_needed_{area}",
+                                "value": 1.0,
+                                "type": "counter",
+                                "labels": _dumps({
+                                    "conversation_id": str(conversation_id),
+                                    "source": "negative_feedback"
+                                }),
+                                "context": _dumps({})
+                            })
+
+                        flag_mids.append(str(message_id))
+                        flag_jsons.append(_dumps({
+                            "needs_review": True,
+                            "improvement_areas": improvement_areas
+                        }))
+
+                if knowledge_items:
+                    created = await self.knowledge_service.add_knowledge_items_bulk(
+                        session, knowledge_items
+                    )
+                    self.learning_metrics["knowledge_items_created"] += len(created)
+
+                if metric_rows:
+                    # executemany: todas as métricas do lote em uma execução
+                    await session.execute(_SQL_INSERT_METRICS_MANY, metric_rows)
+
+                if flag_mids:
+                    # Um único UPDATE para o lote inteiro: unnest dos pares
+                    # (message_id, flag) vira uma relação e o planner faz um
+                    # index scan por linha, sem um round-trip por flag
+                    await session.execute(_SQL_FLAG_MESSAGES_BULK, {"mids": flag_mids, "flags": flag_jsons})
+
+                await session.commit()
+
+                logger.info(f"✅ Lote de feedback processado: {len(rows)} itens")
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao processar lote de feedback: {e}", exc_info=True)
+
     async def _process_positive_feedback(
         self, 
         session: AsyncSession, 
@@ -88,11 +507,15 @@ class LearningService:
     ):
         """Processar feedback positivo para extrair conhecimento"""
         try:
+            # strftime reconstrói a struct tm a cada chamada; uma vez por
+            # feedback basta para os dois títulos
+            today = datetime.now().strftime('%d/%m/%Y')
+
             # Extrair conhecimento de respostas bem avaliadas
             if len(message_content) > 100:  # Apenas respostas substanciais
                 knowledge_id = await self.knowledge_service.add_knowledge_item(
                     db_session=session,
-                    title=f"Resposta bem avaliada - {datetime.now().strftime('%d/%m/%Y')}",
+                    title=f"Resposta bem avaliada - {today}",
                     content=message_content,
                     category="respostas_positivas",
                     source="feedback_positivo",
@@ -106,7 +529,7 @@ class LearningService:
             if comment and len(comment) > 20:
                 await self.knowledge_service.add_knowledge_item(
                     db_session=session,
-                    title=f"Insight do usuário - {datetime.now().strftime('%d/%m/%Y')}",
+                    title=f"Insight do usuário - {today}",
                     content=comment,
                     category="insights_usuarios",
                     source="comentario_positivo",
@@ -125,39 +548,31 @@ class LearningService:
     ):
         """Processar feedback negativo para identificar melhorias"""
         try:
-            # Analisar padrões em feedback negativo
+            # Analisar padrões em feedback negativo (uma passada da regex)
             improvement_areas = []
-            
+
             if comment:
-                comment_lower = comment.lower()
-                
-                # Identificar áreas de melhoria
-                if any(word in comment_lower for word in ['lento', 'devagar', 'demora']):
-                    improvement_areas.append('performance')
-                if any(word in comment_lower for word in ['errado', 'incorreto', 'impreciso']):
-                    improvement_areas.append('accuracy')
-                if any(word in comment_lower for word in ['confuso', 'não entendi', 'vago']):
-                    improvement_areas.append('clarity')
-                if any(word in comment_lower for word in ['incompleto', 'faltou']):
-                    improvement_areas.append('completeness')
+                matched = {m.lastgroup for m in _IMPROVEMENT_RE.finditer(comment)}
+                improvement_areas = [a for a in _IMPROVEMENT_AREAS if a in matched]
             
-            # Registrar áreas de melhoria identificadas
-            for area in improvement_areas:
-                await self.metrics_service.record_system_metric(
-                    f"improvement_needed_{area}",
-                    1.0,
-                    {"conversation_id": conversation_id, "source": "negative_feedback"}
-                )
+            # Registrar áreas de melhoria identificadas em um único lote
+            if improvement_areas:
+                await self.metrics_service.record_system_metrics_bulk(session, [
+                    {
+                        "metric_name": f"improvement_needed_{area}",
+                        "metric_value": 1.0,
+                        "metric_type": "counter",
+                        "labels": {
+                            "conversation_id": str(conversation_id),
+                            "source": "negative_feedback"
+                        }
+                    }
+                    for area in improvement_areas
+                ])
             
             # Marcar resposta para revisão
-            await session.execute(text("""
-                UPDATE messages 
-                SET metadata = metadata || :flag
-                WHERE id = (
-                    SELECT message_id FROM feedback WHERE conversation_id = :conv_id
-                )
-            """), {
-                "flag": json.dumps({"needs_review": True, "improvement_areas": improvement_areas}),
+            await session.execute(_SQL_FLAG_MESSAGE_BY_CONV, {
+                "flag": _dumps({"needs_review": True, "improvement_areas": improvement_areas}),
                 "conv_id": conversation_id
             })
             
@@ -166,29 +581,34 @@ class LearningService:
         except Exception as e:
             logger.error(f"❌ Erro ao processar feedback negativo: {e}", exc_info=True)
     
-    async def _check_model_optimization_trigger(self, session: AsyncSession, message_id: str):
+    async def _query_feedback_stats(self, message_id: str):
+        """Contar feedbacks e média da mensagem em uma sessão dedicada
+
+        Roda em paralelo com o processamento do feedback; a sessão própria
+        garante concorrência real via pool de conexões.
+        """
+        async with self.database_service.session_factory() as session:
+            result = await session.execute(_SQL_FEEDBACK_STATS, {"message_id": message_id})
+
+            return result.fetchone()
+
+    async def _check_model_optimization_trigger(
+        self,
+        session: AsyncSession,
+        message_id: str,
+        count: int,
+        avg_rating: Optional[float]
+    ):
         """Verificar se deve disparar otimização do modelo"""
         try:
-            # Contar feedbacks para esta mensagem
-            result = await session.execute(text("""
-                SELECT COUNT(*), AVG(rating)
-                FROM feedback 
-                WHERE message_id = :message_id
-            """), {"message_id": message_id})
-            
-            count, avg_rating = result.fetchone()
-            
             if count >= self.feedback_threshold:
                 logger.info(f"🎯 Threshold atingido para mensagem {message_id}. Disparando otimização...")
                 
                 # Criar sessão de aprendizado
-                session_id = str(uuid.uuid4())
-                await session.execute(text("""
-                    INSERT INTO learning_sessions (id, session_type, status, input_data)
-                    VALUES (:id, 'model_optimization', 'pending', :input_data)
-                """), {
+                session_id = _next_uuid()
+                await session.execute(_SQL_CREATE_OPTIMIZATION_SESSION, {
                     "id": session_id,
-                    "input_data": json.dumps({
+                    "input_data": _dumps({
                         "trigger_message_id": message_id,
                         "feedback_count": count,
                         "avg_rating": float(avg_rating) if avg_rating else 0
@@ -196,12 +616,37 @@ class LearningService:
                 })
                 
                 await session.commit()
-                
-                # Disparar otimização assíncrona
-                asyncio.create_task(self.run_learning_session(session_id, "model_optimization"))
-                
+
+                # Enfileirar otimização para os workers; com a fila cheia a
+                # sessão fica 'pending' no banco e é apenas logada (backpressure)
+                self._ensure_learning_workers()
+                try:
+                    self._learning_queue.put_nowait((session_id, "model_optimization"))
+                except asyncio.QueueFull:
+                    logger.warning(f"⚠️ Fila de aprendizado cheia - sessão {session_id} permanece pendente")
+
         except Exception as e:
             logger.error(f"❌ Erro ao verificar trigger de otimização: {e}", exc_info=True)
+
+    def _ensure_learning_workers(self, n_workers: int = 4):
+        """Criar os workers da fila de aprendizado na primeira utilização"""
+        if not self._learning_workers:
+            self._learning_workers = [
+                asyncio.create_task(self._learning_worker_loop())
+                for _ in range(n_workers)
+            ]
+            logger.info(f"👷 {n_workers} workers de aprendizado iniciados")
+
+    async def _learning_worker_loop(self):
+        """Consumir sessões de aprendizado da fila, uma por vez por worker"""
+        while True:
+            session_id, session_type = await self._learning_queue.get()
+            try:
+                await self.run_learning_session(session_id, session_type)
+            except Exception as e:
+                logger.error(f"❌ Erro no worker de aprendizado: {e}", exc_info=True)
+            finally:
+                self._learning_queue.task_done()
     
     async def run_learning_session(self, session_id: str, session_type: str):
         """Executar sessão de aprendizado"""
@@ -210,11 +655,7 @@ class LearningService:
             
             async with self.database_service.session_factory() as session:
                 # Marcar sessão como em execução
-                await session.execute(text("""
-                    UPDATE learning_sessions 
-                    SET status = 'running', started_at = CURRENT_TIMESTAMP
-                    WHERE id = :session_id
-                """), {"session_id": session_id})
+                await session.execute(_SQL_SESSION_MARK_RUNNING, {"session_id": session_id})
                 await session.commit()
                 
                 # Executar tipo específico de aprendizado
@@ -228,14 +669,10 @@ class LearningService:
                     result = {"error": f"Tipo de sessão desconhecido: {session_type}"}
                 
                 # Atualizar sessão com resultado
-                await session.execute(text("""
-                    UPDATE learning_sessions 
-                    SET status = :status, completed_at = CURRENT_TIMESTAMP, output_data = :output
-                    WHERE id = :session_id
-                """), {
+                await session.execute(_SQL_SESSION_MARK_DONE, {
                     "session_id": session_id,
                     "status": "completed" if "error" not in result else "failed",
-                    "output": json.dumps(result)
+                    "output": _dumps(result)
                 })
                 await session.commit()
                 
@@ -251,11 +688,7 @@ class LearningService:
             # Marcar sessão como falhada
             try:
                 async with self.database_service.session_factory() as session:
-                    await session.execute(text("""
-                        UPDATE learning_sessions 
-                        SET status = 'failed', completed_at = CURRENT_TIMESTAMP, error_message = :error
-                        WHERE id = :session_id
-                    """), {"session_id": session_id, "error": str(e)})
+                    await session.execute(_SQL_SESSION_MARK_FAILED, {"session_id": session_id, "error": str(e)})
                     await session.commit()
             except:
                 pass
@@ -263,16 +696,9 @@ class LearningService:
     async def _run_model_optimization(self, session: AsyncSession, session_id: str) -> Dict[str, Any]:
         """Executar otimização do modelo baseada em feedback"""
         try:
-            # Analisar feedback recente
-            result = await session.execute(text("""
-                SELECT 
-                    AVG(rating) as avg_rating,
-                    COUNT(*) as total_feedback,
-                    COUNT(CASE WHEN rating <= 2 THEN 1 END) as negative_feedback,
-                    COUNT(CASE WHEN rating >= 4 THEN 1 END) as positive_feedback
-                FROM feedback
-                WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
-            """))
+            # Analisar feedback recente via rollup diário: O(dias) linhas
+            # lidas em vez de reagregar a tabela de feedback inteira
+            result = await session.execute(_SQL_OPTIMIZATION_WINDOW_STATS)
             
             stats = result.fetchone()
             if not stats:
@@ -281,7 +707,6 @@ class LearningService:
             avg_rating, total_feedback, negative_feedback, positive_feedback = stats
             
             optimization_result = {
-                "session_id": session_id,
                 "analysis": {
                     "avg_rating": float(avg_rating) if avg_rating else 0,
                     "total_feedback": total_feedback,
@@ -312,19 +737,17 @@ class LearningService:
                 optimization_result["optimizations_applied"].append("creative_tuning")
                 self.learning_metrics["model_adjustments"] += 1
             
-            # Analisar padrões específicos de feedback negativo
+            # Analisar padrões específicos de feedback negativo: a
+            # classificação roda no banco (FILTER + regex) e volta uma
+            # linha de contadores em vez do texto de todos os comentários
             if negative_feedback > 5:
-                result = await session.execute(text("""
-                    SELECT comment
-                    FROM feedback
-                    WHERE rating <= 2 
-                    AND comment IS NOT NULL
-                    AND created_at >= CURRENT_DATE - INTERVAL '7 days'
-                """))
-                
-                negative_comments = [row[0] for row in result.fetchall()]
-                patterns = self._analyze_negative_patterns(negative_comments)
-                
+                result = await session.execute(_SQL_NEGATIVE_PATTERN_HITS)
+
+                hits = result.fetchone()
+                patterns = [
+                    p for p, count in zip(_NEGATIVE_PATTERNS, hits) if count
+                ] if hits else []
+
                 optimization_result["negative_patterns"] = patterns
                 
                 # Aplicar correções baseadas nos padrões
@@ -348,49 +771,40 @@ class LearningService:
             logger.info("📚 Executando expansão da base de conhecimento...")
             
             # Identificar lacunas de conhecimento
-            result = await session.execute(text("""
-                SELECT 
-                    m.content,
-                    COUNT(f.id) as feedback_count,
-                    AVG(f.rating) as avg_rating
-                FROM messages m
-                LEFT JOIN feedback f ON m.id = f.message_id
-                WHERE m.sender = 'assistant'
-                AND m.timestamp >= CURRENT_DATE - INTERVAL '14 days'
-                GROUP BY m.content
-                HAVING COUNT(f.id) >= 2 AND AVG(f.rating) <= 2.5
-                ORDER BY COUNT(f.id) DESC
-                LIMIT 10
-            """))
+            result = await session.execute(_SQL_PROBLEMATIC_RESPONSES)
             
             problematic_responses = result.fetchall()
             
             expansion_result = {
-                "session_id": session_id,
                 "problematic_responses_found": len(problematic_responses),
                 "knowledge_gaps_identified": [],
                 "new_knowledge_items": 0
             }
             
-            # Analisar respostas problemáticas para identificar lacunas
+            # Analisar respostas problemáticas para identificar lacunas,
+            # acumulando os itens e inserindo em um único lote (COPY acima
+            # do limiar, insertmanyvalues abaixo) em vez de um INSERT +
+            # commit por lacuna
+            gap_items = []
             for response_content, feedback_count, avg_rating in problematic_responses:
                 gap = await self._identify_knowledge_gap(response_content)
                 if gap:
                     expansion_result["knowledge_gaps_identified"].append(gap)
-                    
-                    # Criar item de conhecimento para preencher a lacuna
-                    knowledge_id = await self.knowledge_service.add_knowledge_item(
-                        db_session=session,
-                        title=f"Lacuna identificada: {gap['topic']}",
-                        content=gap['suggested_content'],
-                        category="lacunas_identificadas",
-                        source="learning_session",
-                        confidence_score=0.6
-                    )
-                    
-                    expansion_result["new_knowledge_items"] += 1
-                    self.learning_metrics["knowledge_items_created"] += 1
-            
+                    gap_items.append({
+                        "title": f"Lacuna identificada: {gap['topic']}",
+                        "content": gap['suggested_content'],
+                        "category": "lacunas_identificadas",
+                        "source": "learning_session",
+                        "confidence_score": 0.6
+                    })
+
+            if gap_items:
+                created = await self.knowledge_service.add_knowledge_items_bulk(
+                    session, gap_items
+                )
+                expansion_result["new_knowledge_items"] = len(created)
+                self.learning_metrics["knowledge_items_created"] += len(created)
+
             return expansion_result
             
         except Exception as e:
@@ -401,86 +815,71 @@ class LearningService:
         """Executar análise abrangente do sistema"""
         try:
             logger.info("🔍 Executando análise abrangente do sistema...")
-            
-            # Análise de tendências de performance
-            result = await session.execute(text("""
-                SELECT 
-                    DATE(timestamp) as date,
-                    AVG(metric_value) as avg_response_time,
-                    COUNT(*) as request_count
-                FROM performance_metrics
-                WHERE metric_name = 'response_time'
-                AND timestamp >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY DATE(timestamp)
-                ORDER BY date DESC
-                LIMIT 30
-            """))
-            
-            performance_trend = [
-                {
-                    "date": row[0].isoformat(),
-                    "avg_response_time": float(row[1]) if row[1] else 0,
-                    "request_count": row[2]
-                }
-                for row in result.fetchall()
-            ]
-            
-            # Análise de satisfação do usuário
-            result = await session.execute(text("""
-                SELECT 
-                    DATE(created_at) as date,
-                    AVG(rating) as avg_rating,
-                    COUNT(*) as feedback_count
-                FROM feedback
-                WHERE created_at >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY DATE(created_at)
-                ORDER BY date DESC
-                LIMIT 30
-            """))
-            
-            satisfaction_trend = [
-                {
-                    "date": row[0].isoformat(),
-                    "avg_rating": float(row[1]) if row[1] else 0,
-                    "feedback_count": row[2]
-                }
-                for row in result.fetchall()
-            ]
-            
-            # Análise de tópicos mais discutidos
-            result = await session.execute(text("""
-                SELECT 
-                    kb.category,
-                    COUNT(*) as usage_count,
-                    AVG(kb.confidence_score) as avg_confidence
-                FROM knowledge_base kb
-                WHERE kb.last_used_at >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY kb.category
-                ORDER BY usage_count DESC
-                LIMIT 10
-            """))
-            
+
+            # As três consultas não têm dependência entre si: cada uma roda
+            # em sessão própria e o gather sobrepõe as esperas de I/O.
+            # A sessão original fica reservada para o UPDATE de
+            # learning_sessions feito pelo chamador.
+            async def _fetch(sql):
+                async with self.database_service.session_factory() as s:
+                    return (await s.execute(sql)).fetchall()
+
+            perf_rows, sat_rows, topic_rows = await asyncio.gather(
+                _fetch(_SQL_ANALYSIS_PERF_TREND),
+                _fetch(_SQL_ANALYSIS_SAT_TREND),
+                _fetch(_SQL_ANALYSIS_TOP_TOPICS)
+            )
+
+            # Layout colunar (SoA): colunas paralelas em vez de um dict por
+            # linha — menos objetos Python e arrays contíguos para o NumPy.
+            # As consultas retornam DESC; invertemos para ordem cronológica.
+            if perf_rows:
+                perf_dates, _, perf_counts = map(list, zip(*reversed(perf_rows)))
+            else:
+                perf_dates, perf_counts = [], []
+            if sat_rows:
+                sat_dates, _, sat_counts = map(list, zip(*reversed(sat_rows)))
+            else:
+                sat_dates, sat_counts = [], []
+
+            perf_arr = np.fromiter(
+                (row[1] or 0 for row in reversed(perf_rows)),
+                dtype=np.float64, count=len(perf_rows)
+            )
+            sat_arr = np.fromiter(
+                (row[1] or 0 for row in reversed(sat_rows)),
+                dtype=np.float64, count=len(sat_rows)
+            )
+
             popular_topics = [
                 {
                     "category": row[0] or "Sem categoria",
                     "usage_count": row[1],
                     "avg_confidence": float(row[2]) if row[2] else 0
                 }
-                for row in result.fetchall()
+                for row in topic_rows
             ]
-            
-            # Gerar insights e recomendações
+
+            # Gerar insights (código, mensagem) e recomendações por tabela
             insights = await self._generate_system_insights(
-                performance_trend, satisfaction_trend, popular_topics
+                perf_arr, sat_arr, popular_topics
             )
-            
+
             analysis_result = {
-                "session_id": session_id,
                 "analysis_period": "30 days",
-                "performance_trend": performance_trend[-7:],  # Últimos 7 dias
-                "satisfaction_trend": satisfaction_trend[-7:],
+                # Últimos 7 dias, serializados como colunas paralelas
+                "performance_trend": {
+                    "dates": [d.isoformat() for d in perf_dates[-7:]],
+                    "avg_response_time": perf_arr[-7:].tolist(),
+                    "request_count": perf_counts[-7:]
+                },
+                "satisfaction_trend": {
+                    "dates": [d.isoformat() for d in sat_dates[-7:]],
+                    "avg_rating": sat_arr[-7:].tolist(),
+                    "feedback_count": sat_counts[-7:]
+                },
                 "popular_topics": popular_topics,
-                "insights": insights,
+                "insights": [message for _, message in insights],
                 "recommendations": await self._generate_recommendations(insights)
             }
             
@@ -492,137 +891,140 @@ class LearningService:
     
     def _analyze_negative_patterns(self, comments: List[str]) -> List[str]:
         """Analisar padrões em comentários negativos"""
-        patterns = []
-        
         if not comments:
-            return patterns
-        
-        all_comments = " ".join(comments).lower()
-        
-        # Detectar padrões comuns
-        if any(word in all_comments for word in ['muito longo', 'extenso', 'prolixo']):
-            patterns.append("response_length")
-        
-        if any(word in all_comments for word in ['técnico', 'complexo', 'difícil']):
-            patterns.append("technical_complexity")
-        
-        if any(word in all_comments for word in ['impreciso', 'errado', 'incorreto']):
-            patterns.append("technical_accuracy")
-        
-        if any(word in all_comments for word in ['vago', 'genérico', 'superficial']):
-            patterns.append("response_depth")
-        
-        return patterns
+            return []
+
+        # Uma única passada da regex compilada sobre o texto concatenado
+        all_comments = " ".join(comments)
+        matched = {m.lastgroup for m in _NEGATIVE_PATTERN_RE.finditer(all_comments)}
+
+        return [p for p in _NEGATIVE_PATTERNS if p in matched]
     
     async def _identify_knowledge_gap(self, response_content: str) -> Optional[Dict[str, Any]]:
         """Identificar lacuna de conhecimento em resposta problemática"""
         try:
-            # Análise simples para identificar tópicos
-            content_lower = response_content.lower()
-            
-            # Identificar possíveis tópicos técnicos
-            technical_terms = [
-                "python", "javascript", "api", "database", "sql", "machine learning",
-                "ai", "algoritmo", "programação", "desenvolvimento", "sistema"
-            ]
-            
-            identified_topics = [term for term in technical_terms if term in content_lower]
-            
-            if identified_topics:
-                return {
-                    "topic": identified_topics[0],
-                    "suggested_content": f"Informações detalhadas sobre {identified_topics[0]} baseadas em feedback negativo",
+            # Chave pelo prefixo do conteúdo: suficiente para deduplicar
+            # respostas recorrentes sem hashear o corpo inteiro
+            key = hashlib.blake2b(
+                response_content[:512].encode(), digest_size=16
+            ).digest()
+
+            async with self._gap_cache_lock:
+                if key in self._gap_cache:
+                    self._gap_cache_hits += 1
+                    return self._gap_cache[key]
+                self._gap_cache_misses += 1
+
+            # Primeira ocorrência de termo técnico na resposta
+            m = _TECH_RE.search(response_content)
+
+            gap = None
+            if m:
+                topic = m.group(1).lower()
+                gap = {
+                    "topic": topic,
+                    "suggested_content": f"Informações detalhadas sobre {topic} baseadas em feedback negativo",
                     "confidence": 0.6,
                     "source": "gap_analysis"
                 }
-            
-            return None
+
+            async with self._gap_cache_lock:
+                self._gap_cache[key] = gap
+
+            return gap
             
         except Exception as e:
             logger.error(f"❌ Erro ao identificar lacuna: {e}")
             return None
     
     async def _generate_system_insights(
-        self, 
-        performance_trend: List[Dict], 
-        satisfaction_trend: List[Dict], 
+        self,
+        perf_arr: np.ndarray,
+        sat_arr: np.ndarray,
         popular_topics: List[Dict]
-    ) -> List[str]:
-        """Gerar insights sobre o sistema"""
+    ) -> List[Tuple[InsightCode, str]]:
+        """Gerar insights sobre o sistema
+
+        Recebe as séries como arrays NumPy em ordem cronológica: médias e
+        inclinações são calculadas vetorizadas, sem loops Python sobre as
+        janelas de tendência. Cada insight sai como (código, mensagem).
+        """
         insights = []
-        
+
         try:
             # Análise de tendência de performance
-            if len(performance_trend) >= 3:
-                recent_times = [day["avg_response_time"] for day in performance_trend[-3:]]
-                avg_recent = sum(recent_times) / len(recent_times)
-                
+            if perf_arr.size >= 3:
+                avg_recent = float(perf_arr[-3:].mean())
+
                 if avg_recent > 3.0:
-                    insights.append("Performance degradada nos últimos dias - considerar otimização")
+                    insights.append((InsightCode.PERF_DEGRADED,
+                                     "Performance degradada nos últimos dias - considerar otimização"))
                 elif avg_recent < 1.0:
-                    insights.append("Performance excelente - sistema otimizado")
-            
+                    insights.append((InsightCode.PERF_EXCELLENT,
+                                     "Performance excelente - sistema otimizado"))
+
+                # Inclinação da reta ajustada: detecta degradação gradual
+                # que a média de 3 dias ainda não cruza o limiar
+                if perf_arr.size >= 7:
+                    slope, _ = np.polyfit(np.arange(perf_arr.size), perf_arr, 1)
+                    if slope > 0.1:
+                        insights.append((InsightCode.PERF_RISING,
+                                         "Tempo de resposta em tendência de alta - investigar antes que degrade"))
+
             # Análise de satisfação
-            if len(satisfaction_trend) >= 3:
-                recent_ratings = [day["avg_rating"] for day in satisfaction_trend[-3:]]
-                avg_rating = sum(recent_ratings) / len(recent_ratings)
-                
+            if sat_arr.size >= 3:
+                avg_rating = float(sat_arr[-3:].mean())
+
                 if avg_rating > 4.0:
-                    insights.append("Alta satisfação do usuário - manter estratégias atuais")
+                    insights.append((InsightCode.SAT_HIGH,
+                                     "Alta satisfação do usuário - manter estratégias atuais"))
                 elif avg_rating < 3.0:
-                    insights.append("Satisfação baixa - revisar qualidade das respostas")
-            
+                    insights.append((InsightCode.SAT_LOW,
+                                     "Satisfação baixa - revisar qualidade das respostas"))
+
+                if sat_arr.size >= 7:
+                    slope, _ = np.polyfit(np.arange(sat_arr.size), sat_arr, 1)
+                    if slope < -0.05:
+                        insights.append((InsightCode.SAT_FALLING,
+                                         "Satisfação em tendência de queda - revisar mudanças recentes"))
+
             # Análise de tópicos populares
             if popular_topics:
                 top_topic = popular_topics[0]
-                insights.append(f"Tópico mais popular: {top_topic['category']} ({top_topic['usage_count']} usos)")
-                
+                insights.append((InsightCode.TOP_TOPIC,
+                                 f"Tópico mais popular: {top_topic['category']} ({top_topic['usage_count']} usos)"))
+
                 if top_topic["avg_confidence"] < 0.7:
-                    insights.append(f"Baixa confiança no tópico {top_topic['category']} - necessita melhoria")
-            
+                    insights.append((InsightCode.LOW_CONFIDENCE,
+                                     f"Baixa confiança no tópico {top_topic['category']} - necessita melhoria"))
+
             return insights
-            
+
         except Exception as e:
             logger.error(f"❌ Erro ao gerar insights: {e}")
-            return ["Erro na geração de insights"]
-    
-    async def _generate_recommendations(self, insights: List[str]) -> List[str]:
-        """Gerar recomendações baseadas nos insights"""
-        recommendations = []
-        
-        for insight in insights:
-            if "performance degradada" in insight.lower():
-                recommendations.append("Otimizar infraestrutura ou modelo para melhorar tempo de resposta")
-            elif "satisfação baixa" in insight.lower():
-                recommendations.append("Revisar prompts do sistema e qualidade das respostas")
-            elif "baixa confiança" in insight.lower():
-                recommendations.append("Expandir base de conhecimento em tópicos com baixa confiança")
-            elif "alta satisfação" in insight.lower():
-                recommendations.append("Documentar estratégias atuais como melhores práticas")
-        
+            return []
+
+    async def _generate_recommendations(self, insights: List[Tuple[InsightCode, str]]) -> List[str]:
+        """Gerar recomendações por lookup na tabela código -> recomendação"""
+        recommendations = [
+            _REC_TABLE[code] for code, _ in insights if code in _REC_TABLE
+        ]
+
         # Recomendações gerais se nenhuma específica foi gerada
         if not recommendations:
             recommendations.append("Continuar monitoramento e coleta de feedback")
             recommendations.append("Expandir base de conhecimento com novos tópicos")
-        
+
         return recommendations
     
     async def get_learning_analysis(self, db_session: AsyncSession, days: int = 7) -> Dict[str, Any]:
         """Obter análise de aprendizado dos últimos dias"""
         try:
-            since_date = datetime.now() - timedelta(days=days)
-            
+            now = datetime.now()
+            since_date = now - timedelta(days=days)
+
             # Estatísticas de sessões de aprendizado
-            result = await db_session.execute(text("""
-                SELECT 
-                    session_type,
-                    COUNT(*) as total_sessions,
-                    COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_sessions,
-                    AVG(EXTRACT(EPOCH FROM (completed_at - started_at))) as avg_duration
-                FROM learning_sessions
-                WHERE started_at >= :since_date
-                GROUP BY session_type
-            """), {"since_date": since_date})
+            result = await db_session.execute(_SQL_LEARNING_SESSION_STATS, {"since_date": since_date})
             
             session_stats = {}
             for row in result.fetchall():
@@ -635,16 +1037,7 @@ class LearningService:
                 }
             
             # Análise de evolução do conhecimento
-            result = await db_session.execute(text("""
-                SELECT 
-                    DATE(created_at) as date,
-                    COUNT(*) as new_items,
-                    AVG(confidence_score) as avg_confidence
-                FROM knowledge_base
-                WHERE created_at >= :since_date
-                GROUP BY DATE(created_at)
-                ORDER BY date
-            """), {"since_date": since_date})
+            result = await db_session.execute(_SQL_KNOWLEDGE_EVOLUTION, {"since_date": since_date})
             
             knowledge_evolution = [
                 {
@@ -655,12 +1048,18 @@ class LearningService:
                 for row in result.fetchall()
             ]
             
+            gap_lookups = self._gap_cache_hits + self._gap_cache_misses
             return {
                 "analysis_period_days": days,
                 "learning_sessions": session_stats,
                 "knowledge_evolution": knowledge_evolution,
-                "current_metrics": self.learning_metrics.copy(),
-                "last_updated": datetime.now().isoformat()
+                "current_metrics": self.learning_metrics.snapshot(),
+                "gap_cache": {
+                    "hits": self._gap_cache_hits,
+                    "misses": self._gap_cache_misses,
+                    "hit_rate": (self._gap_cache_hits / gap_lookups * 100) if gap_lookups else 0
+                },
+                "last_updated": now.isoformat()
             }
             
         except Exception as e:
@@ -671,50 +1070,31 @@ class LearningService:
         """Gerar recomendações para melhorar o aprendizado"""
         try:
             recommendations = []
-            
+
+            # As quatro contagens chegam em uma única linha, buscada direto
+            # pelo driver (o cache de prepared statements do asyncpg é
+            # indexado pelo texto estável da consulta)
+            conn = await db_session.connection()
+            raw_connection = await conn.get_raw_connection()
+            row = await raw_connection.driver_connection.fetchrow(_RAW_RECOMMENDATION_STATS)
+            total_messages, total_feedback, categories_count, recent_sessions = row
+
             # Verificar taxa de feedback
-            result = await db_session.execute(text("""
-                SELECT 
-                    COUNT(DISTINCT m.id) as total_messages,
-                    COUNT(f.id) as total_feedback
-                FROM messages m
-                LEFT JOIN feedback f ON m.id = f.message_id
-                WHERE m.sender = 'assistant'
-                AND m.timestamp >= CURRENT_DATE - INTERVAL '7 days'
-            """))
-            
-            stats = result.fetchone()
-            if stats:
-                total_messages, total_feedback = stats
-                feedback_rate = (total_feedback / total_messages) if total_messages > 0 else 0
-                
-                if feedback_rate < 0.1:  # Menos de 10% de feedback
-                    recommendations.append("Incentivar mais feedback dos usuários para melhorar aprendizado")
-                elif feedback_rate > 0.5:  # Mais de 50% de feedback
-                    recommendations.append("Excelente taxa de feedback - aproveitar para otimizações frequentes")
-            
+            feedback_rate = (total_feedback / total_messages) if total_messages > 0 else 0
+
+            if feedback_rate < 0.1:  # Menos de 10% de feedback
+                recommendations.append("Incentivar mais feedback dos usuários para melhorar aprendizado")
+            elif feedback_rate > 0.5:  # Mais de 50% de feedback
+                recommendations.append("Excelente taxa de feedback - aproveitar para otimizações frequentes")
+
             # Verificar diversidade de tópicos
-            result = await db_session.execute(text("""
-                SELECT COUNT(DISTINCT category) as categories_count
-                FROM knowledge_base
-            """))
-            
-            categories_count = result.scalar() or 0
-            if categories_count < 5:
+            if (categories_count or 0) < 5:
                 recommendations.append("Expandir diversidade de tópicos na base de conhecimento")
-            
+
             # Verificar sessões de aprendizado recentes
-            result = await db_session.execute(text("""
-                SELECT COUNT(*) as recent_sessions
-                FROM learning_sessions
-                WHERE started_at >= CURRENT_DATE - INTERVAL '7 days'
-                AND status = 'completed'
-            """))
-            
-            recent_sessions = result.scalar() or 0
-            if recent_sessions == 0:
+            if (recent_sessions or 0) == 0:
                 recommendations.append("Executar sessão de aprendizado para otimizar sistema")
-            
+
             return recommendations
             
         except Exception as e:
@@ -3,178 +3,441 @@ Serviço de Métricas e Monitoramento
 Sistema de IA Conversacional Avançada
 """
 
-import json
+import re
+import time
+import asyncio
+import orjson
 import psutil
-from typing import Dict, Any, List
+from cachetools import TTLCache
+from typing import Dict, Any, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 
 from app.logger import logger
+from backend.database.connection import AsyncSessionLocal, engine
+from backend.services.database_service import _SQL_UPSERT_METRIC_ROLLUPS
+
+def _dumps(obj: Any) -> str:
+    """Serializar JSON com orjson (encoder nativo, bem mais rápido que o
+    stdlib no caminho quente de ingestão de métricas)"""
+    return orjson.dumps(obj).decode()
+
+# Insert em lote do buffer de métricas, com timestamp capturado no enfileiro
+# (não no flush) para não distorcer as séries
+_SQL_INSERT_METRICS = text("""
+    INSERT INTO performance_metrics
+    (metric_name, metric_value, metric_type, labels, context, timestamp)
+    VALUES (:name, :value, :type, :labels, :context, :ts)
+""")
+
+# Variante sem timestamp explícito (o default da coluna aplica). Como as
+# demais constantes do módulo, o texto estável garante hit no cache de
+# compilação do SQLAlchemy e no cache de prepared statements do asyncpg
+# (statement_cache_size) — o servidor pula parse + plan em cada lote
+_SQL_INSERT_METRICS_BULK = text("""
+    INSERT INTO performance_metrics
+    (metric_name, metric_value, metric_type, labels, context)
+    VALUES (:name, :value, :type, :labels, :context)
+""")
+
+# Tendências direto do rollup multi-granularidade: range scan na chave
+# primária, sem GROUP BY sobre a tabela base. A média móvel sai em uma
+# única passada com window function (estatísticas suficientes
+# recombinadas dentro da janela); a janela nomeada é compartilhada pelos
+# agregados, então o PG ordena uma vez só. O quadro da janela é escalado
+# à granularidade do bucket (7 buckets diários ou 168 horários), para
+# rolling_7d significar 7 dias em qualquer zoom — quadros não aceitam
+# bind param, daí uma constante por granularidade
+_TREND_RESPONSE_TIME_TEMPLATE = """
+    SELECT
+        bucket_ts,
+        sum_value / NULLIF(sample_count, 0) AS avg_value,
+        sample_count,
+        SUM(sum_value) OVER w
+            / NULLIF(SUM(sample_count) OVER w, 0) AS rolling_7d
+    FROM performance_metrics_rollup
+    WHERE metric_name = 'response_time'
+    AND granularity_sec = :granularity
+    AND bucket_ts >= :since_ts
+    WINDOW w AS (ORDER BY bucket_ts ROWS BETWEEN {frame} PRECEDING AND CURRENT ROW)
+    ORDER BY bucket_ts
+"""
+
+_SQL_TREND_RESPONSE_TIME_DAILY = text(_TREND_RESPONSE_TIME_TEMPLATE.format(frame=6))
+_SQL_TREND_RESPONSE_TIME_HOURLY = text(_TREND_RESPONSE_TIME_TEMPLATE.format(frame=167))
+
+_SQL_TREND_SATISFACTION = text("""
+    SELECT
+        date,
+        avg_rating,
+        total_feedback,
+        (SUM(sum_rating) OVER w)::float
+            / NULLIF(SUM(total_feedback) OVER w, 0) AS rolling_7d
+    FROM feedback_daily_stats
+    WHERE date >= :since_date
+    WINDOW w AS (ORDER BY date ROWS BETWEEN 6 PRECEDING AND CURRENT ROW)
+    ORDER BY date
+""")
+
+# Leituras das views materializadas do dashboard de sistema
+_SQL_SM_CONVERSATIONS = text("""
+    SELECT total_conversations, total_messages, unique_users
+    FROM mv_conv_stats_30d
+""")
+
+# Agregação algébrica sobre as estatísticas suficientes do rollup diário
+# (mantido no insert de feedback): média = soma/contagem recombinada sobre
+# ~30 linhas, sempre atual, sem depender do ciclo de refresh de uma view
+_SQL_SM_FEEDBACK = text("""
+    SELECT
+        COALESCE(SUM(total_feedback), 0) AS total_feedback,
+        SUM(sum_rating)::float / NULLIF(SUM(total_feedback), 0) AS avg_rating,
+        SUM(positive_count) * 100.0 / NULLIF(SUM(total_feedback), 0) AS positive_rate
+    FROM feedback_daily_stats
+    WHERE date >= CURRENT_DATE - INTERVAL '30 days'
+""")
+
+_SQL_SM_PERFORMANCE = text("""
+    SELECT metric_name, avg_value, max_value, min_value, p50, p95, sample_count
+    FROM mv_perf_metrics_24h
+    ORDER BY metric_name
+""")
+
+_SQL_SM_KNOWLEDGE = text("""
+    SELECT total_items, categories_count, avg_confidence, total_usage
+    FROM mv_knowledge_stats
+""")
+
+_SQL_SM_LEARNING = text("""
+    SELECT session_type, total_sessions, completed_sessions, avg_duration
+    FROM mv_learning_stats_7d
+""")
+
+# Partições semanais de performance_metrics: o nome codifica ano e semana
+# ISO (performance_metrics_y2025w03), no mesmo formato do bootstrap em
+# create_schema
+_METRIC_PARTITION_RE = re.compile(r"^performance_metrics_y(\d{4})w(\d{2})$")
+
+_SQL_LIST_METRIC_PARTITIONS = text("""
+    SELECT tablename FROM pg_tables
+    WHERE schemaname = 'public'
+    AND tablename LIKE 'performance\\_metrics\\_y%'
+""")
 
 class MetricsService:
     """Serviço para coleta e análise de métricas do sistema"""
-    
+
+    # Flush do buffer a cada 500 registros ou 500 ms, o que vier primeiro
+    FLUSH_BATCH = 500
+    FLUSH_INTERVAL = 0.5
+
+    # Intervalo do amostrador de recursos (CPU/memória/disco) em segundos
+    RESOURCE_SAMPLE_INTERVAL = 5.0
+
     def __init__(self):
         self.metrics_retention_days = 30
-        
+
+        # Buffer de métricas: acumula registros e grava em lote, em vez de
+        # um INSERT + commit (round-trip + fsync de WAL) por métrica
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_lock = asyncio.Lock()
+        self._last_flush = time.monotonic()
+
+        # Flush periódico em background: garante que o buffer é gravado a
+        # cada FLUSH_INTERVAL mesmo sem novas métricas chegando
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_loop_owner = None
+
+        # Resposta completa do dashboard cacheada por 30s: o frontend faz
+        # polling a cada poucos segundos e receberia o mesmo payload de
+        # qualquer forma (as views materializadas atualizam a cada 5 min)
+        self._metrics_cache: TTLCache = TTLCache(maxsize=4, ttl=30)
+
+        # Snapshot de recursos mantido por um amostrador em background:
+        # leitores consomem o dict cacheado em O(1) em vez de bloquear o
+        # event loop com psutil.cpu_percent(interval=1) por requisição
+        self._resource_cache: Dict[str, Any] = {}
+        self._sampler_task: Optional[asyncio.Task] = None
+
     async def record_metric(
         self,
-        db_session: AsyncSession,
         metric_name: str,
         metric_value: float,
         metric_type: str = "gauge",
         labels: Optional[Dict[str, str]] = None,
         context: Optional[Dict[str, Any]] = None
     ):
-        """Registrar uma métrica no banco de dados"""
+        """Registrar uma métrica (bufferizada; flush em lote)
+
+        Não recebe sessão: o flush pega uma conexão curta do pool
+        compartilhado, então registrar uma métrica não amarra a transação
+        do chamador nem exige um commit por registro.
+        """
+        self._ensure_flush_loop()
+
+        # Serializar uma única vez, no enfileiro
+        self._buffer.append({
+            "name": metric_name,
+            "value": metric_value,
+            "type": metric_type,
+            "labels": _dumps(labels or {}),
+            "context": _dumps(context or {}),
+            # Aware em UTC: o asyncpg interpreta datetime ingênuo como UTC
+            # ao ligar em timestamptz, o que deslocaria os buckets em
+            # hosts fora de UTC
+            "ts": datetime.now(timezone.utc)
+        })
+
+        if (len(self._buffer) >= self.FLUSH_BATCH
+                or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL):
+            await self._flush_buffer()
+
+    def _ensure_flush_loop(self):
+        """Criar o flush periódico no primeiro registro de cada event loop
+
+        As tarefas do Celery rodam cada uma sob um asyncio.run() novo,
+        então a task é recriada sempre que o loop corrente muda.
+        """
+        loop = asyncio.get_running_loop()
+        if (self._flush_task is None
+                or self._flush_loop_owner is not loop
+                or self._flush_task.done()):
+            self._flush_task = loop.create_task(self._flush_loop())
+            self._flush_loop_owner = loop
+
+    async def _flush_loop(self):
+        """Drenar o buffer periodicamente, mesmo sob ingestão ociosa"""
+        while True:
+            try:
+                await asyncio.sleep(self.FLUSH_INTERVAL)
+                await self._flush_buffer()
+            except asyncio.CancelledError:
+                # Drenar o que restou antes de encerrar
+                await self._flush_buffer()
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erro no flush periódico de métricas: {e}", exc_info=True)
+
+    async def close(self):
+        """Encerrar o serviço drenando o buffer pendente
+
+        Chamar antes do event loop sair (fim de tarefa Celery, shutdown da
+        API); sem isso, métricas bufferizadas após o último flush seriam
+        descartadas junto com o loop.
+        """
+        if self._sampler_task and not self._sampler_task.done():
+            self._sampler_task.cancel()
+            try:
+                await self._sampler_task
+            except asyncio.CancelledError:
+                pass
+        self._sampler_task = None
+
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+        self._flush_loop_owner = None
+        await self._flush_buffer()
+
+    async def _flush_buffer(self):
+        """Gravar o buffer acumulado em uma execução (executemany) e um commit
+
+        Usa uma sessão curta do pool compartilhado só pela duração do
+        flush: a conexão volta ao pool em seguida, sem churn de conexão
+        nem transação pendurada entre flushes.
+        """
+        async with self._buffer_lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+
+            async with AsyncSessionLocal() as db_session:
+                try:
+                    await db_session.execute(_SQL_INSERT_METRICS, rows)
+
+                    # Manter os rollups multi-granularidade no mesmo commit:
+                    # o lote vai como arrays paralelos e o servidor bucketiza
+                    # os quatro níveis em uma única passada
+                    await db_session.execute(_SQL_UPSERT_METRIC_ROLLUPS, {
+                        "names": [row["name"] for row in rows],
+                        "values": [float(row["value"]) for row in rows],
+                        "ts": [row["ts"] for row in rows],
+                    })
+
+                    await db_session.commit()
+
+                except Exception as e:
+                    await db_session.rollback()
+                    logger.error(f"❌ Erro ao registrar métricas: {e}", exc_info=True)
+
+    async def record_system_metrics_bulk(
+        self,
+        db_session: AsyncSession,
+        rows: List[Dict[str, Any]]
+    ):
+        """Registrar várias métricas em uma única execução (executemany)
+
+        Converte N awaits sequenciais em uma ida ao banco; usar no lugar de
+        chamar record_metric em loop.
+        """
+        if not rows:
+            return
+
         try:
-            await db_session.execute(text("""
-                INSERT INTO performance_metrics 
-                (metric_name, metric_value, metric_type, labels, context)
-                VALUES (:name, :value, :type, :labels, :context)
-            """), {
-                "name": metric_name,
-                "value": metric_value,
-                "type": metric_type,
-                "labels": json.dumps(labels or {}),
-                "context": json.dumps(context or {})
-            })
-            
+            await db_session.execute(_SQL_INSERT_METRICS_BULK, [
+                {
+                    "name": row["metric_name"],
+                    "value": row["metric_value"],
+                    "type": row.get("metric_type", "gauge"),
+                    "labels": _dumps(row.get("labels") or {}),
+                    "context": _dumps(row.get("context") or {})
+                }
+                for row in rows
+            ])
+
             await db_session.commit()
-            
+
         except Exception as e:
             await db_session.rollback()
-            logger.error(f"❌ Erro ao registrar métrica: {e}", exc_info=True)
+            logger.error(f"❌ Erro ao registrar métricas em lote: {e}", exc_info=True)
 
     async def get_system_metrics(
         self,
         db_session: AsyncSession
     ) -> Dict[str, Any]:
-        """Obter métricas completas do sistema"""
+        """Obter métricas completas do sistema
+
+        Lê as views materializadas dos dashboards (atualizadas pelo Celery
+        beat a cada 5 minutos) em vez de reagregar as tabelas base a cada
+        chamada: cada seção vira a leitura de poucas linhas pré-calculadas.
+        As cinco leituras são independentes; cada uma roda em sessão própria
+        do pool e o gather sobrepõe os round-trips, então o tempo total vira
+        o da consulta mais lenta em vez da soma das cinco. A resposta
+        completa fica em cache TTL de 30s, então hits não tocam o banco.
+        """
         try:
+            cached = self._metrics_cache.get("global")
+            if cached is not None:
+                return cached
+
             metrics = {}
-            
-            # Métricas de conversas
-            result = await db_session.execute(text("""
-                SELECT 
-                    COUNT(DISTINCT c.id) as total_conversations,
-                    COUNT(m.id) as total_messages,
-                    COUNT(DISTINCT c.user_id) as unique_users
-                FROM conversations c
-                LEFT JOIN messages m ON c.id = m.conversation_id
-                WHERE c.created_at >= CURRENT_DATE - INTERVAL '30 days'
-            """))
-            
-            conv_stats = result.fetchone()
+
+            async def _fetch(sql):
+                async with AsyncSessionLocal() as s:
+                    return (await s.execute(sql)).fetchall()
+
+            conv_rows, feedback_rows, perf_rows, kb_rows, learn_rows = await asyncio.gather(
+                _fetch(_SQL_SM_CONVERSATIONS),
+                _fetch(_SQL_SM_FEEDBACK),
+                _fetch(_SQL_SM_PERFORMANCE),
+                _fetch(_SQL_SM_KNOWLEDGE),
+                _fetch(_SQL_SM_LEARNING)
+            )
+
+            # Métricas de conversas (30 dias, pré-agregadas)
+            conv_stats = conv_rows[0] if conv_rows else None
             metrics["conversations"] = {
                 "total": conv_stats[0] if conv_stats else 0,
                 "total_messages": conv_stats[1] if conv_stats else 0,
                 "unique_users": conv_stats[2] if conv_stats else 0
             }
-            
-            # Métricas de feedback
-            result = await db_session.execute(text("""
-                SELECT 
-                    COUNT(*) as total_feedback,
-                    AVG(rating) as avg_rating,
-                    COUNT(CASE WHEN rating >= 4 THEN 1 END) * 100.0 / COUNT(*) as positive_rate
-                FROM feedback
-                WHERE created_at >= CURRENT_DATE - INTERVAL '30 days'
-            """))
-            
-            feedback_stats = result.fetchone()
+
+            # Métricas de feedback (30 dias, pré-agregadas)
+            feedback_stats = feedback_rows[0] if feedback_rows else None
             metrics["feedback"] = {
                 "total": feedback_stats[0] if feedback_stats else 0,
                 "average_rating": float(feedback_stats[1]) if feedback_stats and feedback_stats[1] else 0,
                 "positive_rate": float(feedback_stats[2]) if feedback_stats and feedback_stats[2] else 0
             }
-            
-            # Métricas de performance
-            result = await db_session.execute(text("""
-                SELECT 
-                    metric_name,
-                    AVG(metric_value) as avg_value,
-                    MAX(metric_value) as max_value,
-                    MIN(metric_value) as min_value,
-                    COUNT(*) as sample_count
-                FROM performance_metrics
-                WHERE timestamp >= CURRENT_DATE - INTERVAL '24 hours'
-                AND metric_type = 'gauge'
-                GROUP BY metric_name
-                ORDER BY metric_name
-            """))
-            
+
+            # Métricas de performance (24 horas, por nome de métrica)
             performance_metrics = {}
-            for row in result.fetchall():
+            for row in perf_rows:
                 performance_metrics[row[0]] = {
                     "average": float(row[1]) if row[1] else 0,
                     "maximum": float(row[2]) if row[2] else 0,
                     "minimum": float(row[3]) if row[3] else 0,
-                    "samples": row[4]
+                    "p50": float(row[4]) if row[4] else 0,
+                    "p95": float(row[5]) if row[5] else 0,
+                    "samples": row[6]
                 }
-            
+
             metrics["performance"] = performance_metrics
-            
+
             # Métricas de base de conhecimento
-            result = await db_session.execute(text("""
-                SELECT 
-                    COUNT(*) as total_items,
-                    COUNT(DISTINCT category) as categories,
-                    AVG(confidence_score) as avg_confidence,
-                    SUM(usage_count) as total_usage
-                FROM knowledge_base
-            """))
-            
-            kb_stats = result.fetchone()
+            kb_stats = kb_rows[0] if kb_rows else None
             metrics["knowledge_base"] = {
                 "total_items": kb_stats[0] if kb_stats else 0,
                 "categories": kb_stats[1] if kb_stats else 0,
                 "avg_confidence": float(kb_stats[2]) if kb_stats and kb_stats[2] else 0,
                 "total_usage": kb_stats[3] if kb_stats else 0
             }
-            
-            # Métricas do sistema (CPU, memória, etc.)
-            system_metrics = self._get_system_resource_metrics()
-            metrics["system"] = system_metrics
-            
-            # Métricas de aprendizado
-            result = await db_session.execute(text("""
-                SELECT 
-                    session_type,
-                    COUNT(*) as total_sessions,
-                    COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_sessions,
-                    AVG(EXTRACT(EPOCH FROM (completed_at - started_at))) as avg_duration
-                FROM learning_sessions
-                WHERE started_at >= CURRENT_DATE - INTERVAL '7 days'
-                GROUP BY session_type
-            """))
-            
+
+            # Métricas do sistema (CPU, memória, etc.) do snapshot cacheado
+            self._ensure_resource_sampler()
+            metrics["system"] = self._get_system_resource_metrics()
+
+            # Métricas de aprendizado (7 dias, por tipo de sessão)
             learning_metrics = {}
-            for row in result.fetchall():
+            for row in learn_rows:
                 learning_metrics[row[0]] = {
                     "total_sessions": row[1],
                     "completed_sessions": row[2],
                     "success_rate": (row[2] / row[1] * 100) if row[1] > 0 else 0,
                     "avg_duration_seconds": float(row[3]) if row[3] else 0
                 }
-            
+
             metrics["learning"] = learning_metrics
-            
+
             # Timestamp da coleta
             metrics["collected_at"] = datetime.now().isoformat()
-            
+
+            self._metrics_cache["global"] = metrics
             return metrics
             
         except Exception as e:
             logger.error(f"❌ Erro ao obter métricas do sistema: {e}", exc_info=True)
             return {"error": str(e)}
 
+    def _ensure_resource_sampler(self):
+        """Criar o amostrador de recursos na primeira utilização"""
+        if self._sampler_task is None:
+            # Primeira chamada prepara a janela do cpu_percent (a leitura
+            # sem intervalo mede o delta desde a chamada anterior)
+            psutil.cpu_percent(interval=None)
+            self._sampler_task = asyncio.create_task(self._resource_sampler())
+
+    async def _resource_sampler(self):
+        """Atualizar o snapshot de recursos periodicamente, fora do event loop"""
+        while True:
+            try:
+                self._resource_cache = await asyncio.to_thread(self._sample_resources)
+                await asyncio.sleep(self.RESOURCE_SAMPLE_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erro no amostrador de recursos: {e}", exc_info=True)
+                await asyncio.sleep(self.RESOURCE_SAMPLE_INTERVAL)
+
     def _get_system_resource_metrics(self) -> Dict[str, Any]:
-        """Obter métricas de recursos do sistema"""
+        """Obter o snapshot de recursos do sistema (cacheado pelo amostrador)"""
+        if self._resource_cache:
+            return self._resource_cache
+
+        # Primeira leitura antes do amostrador popular o cache
+        return self._sample_resources()
+
+    def _sample_resources(self) -> Dict[str, Any]:
+        """Coletar métricas de recursos do sistema"""
         try:
-            # CPU
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU (delta desde a última leitura; não bloqueia)
+            cpu_percent = psutil.cpu_percent(interval=None)
             cpu_count = psutil.cpu_count()
             
             # Memória
@@ -226,51 +489,64 @@ class MetricsService:
         db_session: AsyncSession,
         days: int = 7
     ) -> Dict[str, List[Dict[str, Any]]]:
-        """Obter tendências de performance dos últimos dias"""
+        """Obter tendências de performance dos últimos dias
+
+        Lê os rollups (performance_metrics_rollup e feedback_daily_stats)
+        em vez de reagrupar as tabelas base: range scan de poucas linhas
+        na chave primária. A granularidade é promovida automaticamente —
+        buckets horários para janelas de até 2 dias, diários acima disso.
+        """
         try:
-            since_date = datetime.now() - timedelta(days=days)
-            
-            # Tendência de tempo de resposta
-            result = await db_session.execute(text("""
-                SELECT 
-                    DATE(timestamp) as date,
-                    AVG(metric_value) as avg_response_time,
-                    COUNT(*) as sample_count
-                FROM performance_metrics
-                WHERE metric_name = 'response_time'
-                AND timestamp >= :since_date
-                GROUP BY DATE(timestamp)
-                ORDER BY date
-            """), {"since_date": since_date})
-            
+            # Aquecimento da média móvel: o scan começa 7 dias antes da
+            # janela exibida para a janela de rolling_7d ter histórico
+            # completo já no primeiro ponto (sem isso, um zoom de 2 dias
+            # nunca veria mais de 48 buckets horários); as linhas extras
+            # são descartadas na montagem da resposta
+            since_ts = datetime.now(timezone.utc) - timedelta(days=days)
+            warmup_ts = since_ts - timedelta(days=7)
+            since_date = since_ts.date()
+
+            # Tendência de tempo de resposta, no nível mais grosso que
+            # ainda atende o zoom pedido (a variante carrega o quadro da
+            # janela móvel dimensionado para 7 dias nessa granularidade)
+            if days <= 2:
+                granularity, trend_sql = 3600, _SQL_TREND_RESPONSE_TIME_HOURLY
+            else:
+                granularity, trend_sql = 86400, _SQL_TREND_RESPONSE_TIME_DAILY
+            result = await db_session.execute(
+                trend_sql,
+                {
+                    "granularity": granularity,
+                    "since_ts": warmup_ts
+                }
+            )
+
             response_time_trend = [
                 {
                     "date": row[0].isoformat(),
                     "avg_response_time": float(row[1]) if row[1] else 0,
-                    "sample_count": row[2]
+                    "sample_count": row[2],
+                    "rolling_7d": float(row[3]) if row[3] else 0
                 }
                 for row in result.fetchall()
+                if row[0] >= since_ts
             ]
-            
-            # Tendência de satisfação do usuário
-            result = await db_session.execute(text("""
-                SELECT 
-                    DATE(created_at) as date,
-                    AVG(rating) as avg_rating,
-                    COUNT(*) as feedback_count
-                FROM feedback
-                WHERE created_at >= :since_date
-                GROUP BY DATE(created_at)
-                ORDER BY date
-            """), {"since_date": since_date})
-            
+
+            # Tendência de satisfação do usuário (mesmo aquecimento)
+            result = await db_session.execute(
+                _SQL_TREND_SATISFACTION,
+                {"since_date": warmup_ts.date()}
+            )
+
             satisfaction_trend = [
                 {
                     "date": row[0].isoformat(),
                     "avg_rating": float(row[1]) if row[1] else 0,
-                    "feedback_count": row[2]
+                    "feedback_count": row[2],
+                    "rolling_7d": float(row[3]) if row[3] else 0
                 }
                 for row in result.fetchall()
+                if row[0] >= since_date
             ]
             
             return {
@@ -286,21 +562,109 @@ class MetricsService:
         self,
         db_session: AsyncSession
     ):
-        """Limpar métricas antigas para manter performance"""
+        """Limpar métricas antigas para manter performance
+
+        performance_metrics é particionada por semana ISO: a retenção vira
+        o DROP das partições cujo limite superior ficou antes do corte —
+        O(1) no volume de linhas, sem dead tuples nem VACUUM, ao contrário
+        do DELETE massivo anterior. De passagem garante as partições da
+        semana corrente e da próxima, para a ingestão nunca encontrar uma
+        janela sem partição.
+        """
         try:
             cutoff_date = datetime.now() - timedelta(days=self.metrics_retention_days)
-            
-            result = await db_session.execute(text("""
-                DELETE FROM performance_metrics 
-                WHERE timestamp < :cutoff_date
+
+            # Garantir as partições da semana corrente e da próxima
+            monday = date.today() - timedelta(days=date.today().weekday())
+            for weeks in (0, 1):
+                start = monday + timedelta(weeks=weeks)
+                iso = start.isocalendar()
+                await db_session.execute(text(
+                    f"CREATE UNLOGGED TABLE IF NOT EXISTS "
+                    f"performance_metrics_y{iso[0]}w{iso[1]:02d} "
+                    f"PARTITION OF performance_metrics "
+                    f"FOR VALUES FROM ('{start.isoformat()}') "
+                    f"TO ('{(start + timedelta(days=7)).isoformat()}')"
+                ))
+
+            # Derrubar as partições totalmente expiradas (nome validado
+            # pelo regex antes de interpolar no DROP)
+            result = await db_session.execute(_SQL_LIST_METRIC_PARTITIONS)
+            dropped_count = 0
+            for (tablename,) in result.fetchall():
+                match = _METRIC_PARTITION_RE.match(tablename)
+                if not match:
+                    continue
+                week_end = date.fromisocalendar(
+                    int(match.group(1)), int(match.group(2)), 1
+                ) + timedelta(days=7)
+                if week_end <= cutoff_date.date():
+                    await db_session.execute(text(f"DROP TABLE IF EXISTS {tablename}"))
+                    dropped_count += 1
+
+            # Podar os rollups finos (10s/1min após 7 dias, 1h após a
+            # retenção); os buckets diários são poucos e ficam
+            await db_session.execute(text("""
+                DELETE FROM performance_metrics_rollup
+                WHERE (granularity_sec < 3600 AND bucket_ts < now() - INTERVAL '7 days')
+                OR (granularity_sec = 3600 AND bucket_ts < :cutoff_date)
             """), {"cutoff_date": cutoff_date})
-            
-            deleted_count = result.rowcount
+
             await db_session.commit()
-            
-            if deleted_count > 0:
-                logger.info(f"🧹 Removidas {deleted_count} métricas antigas")
-            
+
+            if dropped_count > 0:
+                logger.info(f"🧹 Removidas {dropped_count} partições antigas de métricas")
+
         except Exception as e:
             await db_session.rollback()
-            logger.error(f"❌ Erro na limpeza de métricas: {e}", exc_info=True)
\ No newline at end of file
+            logger.error(f"❌ Erro na limpeza de métricas: {e}", exc_info=True)
+
+    async def export_metrics(
+        self,
+        target,
+        since: datetime,
+        until: datetime
+    ) -> int:
+        """Exportar métricas brutas do período para um buffer via COPY binário
+
+        Para leituras em massa (exportações analíticas), COPY TO em formato
+        binário escreve direto do PostgreSQL no destino: nada de Row do
+        SQLAlchemy nem formatação/parse de texto por linha — o caminho
+        inteiro fica em C. `target` é qualquer objeto com write(bytes).
+        Retorna o número de linhas exportadas.
+        """
+        try:
+            async with engine.connect() as conn:
+                raw_connection = await conn.get_raw_connection()
+                status = await raw_connection.driver_connection.copy_from_query(
+                    """
+                    SELECT metric_name, metric_value, metric_type,
+                           labels, context, timestamp
+                    FROM performance_metrics
+                    WHERE timestamp >= $1 AND timestamp < $2
+                    ORDER BY timestamp
+                    """,
+                    since, until,
+                    output=target,
+                    format="binary"
+                )
+
+            # asyncpg devolve o status do COPY ('COPY <n>')
+            exported = int(status.split()[-1])
+            logger.info(f"📊 Exportadas {exported} métricas ({since} a {until})")
+            return exported
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao exportar métricas: {e}", exc_info=True)
+            raise
+
+    def get_pool_status(self) -> Dict[str, Any]:
+        """Obter o estado do pool de conexões compartilhado (observabilidade)"""
+        try:
+            return {
+                "status": engine.pool.status(),
+                "buffered_metrics": len(self._buffer)
+            }
+        except Exception as e:
+            logger.error(f"❌ Erro ao obter status do pool: {e}", exc_info=True)
+            return {"error": str(e)}
\ No newline at end of file